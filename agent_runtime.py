@@ -0,0 +1,254 @@
+"""Inference-only runtime of the neural network agent: the planet features, the networks and NeuralPlanetWarsAgent.
+
+It needs only NumPy and the Planet Wars bindings, so loading a trained agent (sharp_agent.py) does not
+import the training dependencies of train_nn.py. torch is imported only by make_network(backend="torch").
+"""
+
+import sys
+import numpy as np
+
+# Adding the python bindings of Planet Wars to the path
+PW_PYTHON_PATH = "planet-wars-rts/app/src/main/python"
+if PW_PYTHON_PATH not in sys.path:
+    sys.path.insert(0, PW_PYTHON_PATH)
+
+from core.game_state import Action, GameState, GameParams, Player  # type: ignore
+from agents.planet_wars_agent import PlanetWarsPlayer  # type: ignore
+from numpy_network import NumpyNetwork
+from profiler import instrument
+
+def build_planet_matrix(state: GameState, params: GameParams, me: Player) -> np.ndarray:
+    """Build a matrix of features of the planets in the game state."""
+    N = len(state.planets)  # Number of planets
+
+    # The game dimensions
+    game_width = params.width
+    game_height = params.height
+
+    # An array for the incoming ships to each planet
+    incoming_friendly = np.zeros((N,), dtype=np.float32)
+    incoming_enemy = np.zeros((N,), dtype=np.float32)
+
+    for planet in state.planets:  # For each planet
+        transporter = planet.transporter  # Transporter to destination planet
+        if transporter is None:  # If there is no transporter, skip
+            continue
+        destination_planet = transporter.destination_index  # The destionation of the transporter
+
+        # If the transporter is owned by me, add the ships to the incoming friendly array
+        if transporter.owner == me:
+            incoming_friendly[destination_planet] += float(transporter.n_ships)
+        # If the transporter is owned by the opponent, add the ships to the incoming enemy array
+        elif transporter.owner == me.opponent():
+            incoming_enemy[destination_planet] += float(transporter.n_ships)
+
+    F = 11
+    M = np.zeros((N, F), dtype=np.float32)
+    for i, p in enumerate(state.planets):
+        tp = p.transporter
+        if tp is not None:  # If there is a transporter, add the position and velocity information to the matrix
+            tp_sx = float(tp.s.x) / game_width
+            tp_sy = float(tp.s.y) / game_height
+            tp_vx = float(tp.v.x) / float(params.transporter_speed)
+            tp_vy = float(tp.v.y) / float(params.transporter_speed)
+        else:  # If there is no transporter, set these values to 0.
+            tp_sx = 0.0
+            tp_sy = 0.0
+            tp_vx = 0.0
+            tp_vy = 0.0
+        
+        # Determine the owner of the planet
+        if p.owner == me:
+            owner_feature = 1
+        elif p.owner == me.opponent():
+            owner_feature = -1
+        elif p.owner == Player.Neutral:
+            owner_feature = 0
+            
+        M[i] = np.array(
+            [
+                owner_feature,
+                min(1.0, float(p.n_ships) / 200.0),
+                min(1.0, float(p.growth_rate) / float(params.max_growth_rate)),
+                float(p.position.x) / game_width,
+                float(p.position.y) / game_height,
+                min(1.0, incoming_friendly[i] / 200.0),
+                min(1.0, incoming_enemy[i] / 200.0),
+                tp_sx, tp_sy,
+                tp_vx, tp_vy,
+            ],
+            dtype=np.float32,
+        )
+
+    return M
+
+class PlanetFeatureExtractor:
+    """Array-backed version of build_planet_matrix that reuses its buffers across ticks.
+
+    The positions and growth rates of the planets never change during a game, so their columns are
+    computed on the first call after reset() (or when the number of planets or the params change)
+    and only the owner, ship, incoming fleet and transporter columns are updated on every tick.
+    The output is bit-for-bit identical to build_planet_matrix (under NumPy >= 2 promotion rules).
+    The returned matrix is owned by the extractor and is overwritten on the next call.
+    """
+    NUM_FEATURES = 11
+    # Columns of the raw field matrix of the per-tick (dynamic) fields
+    OWNER, SHIPS, TP_SLOT, TP_SHIPS, TP_SX, TP_SY, TP_VX, TP_VY = range(8)
+
+    def __init__(self, num_planets=0):
+        self._allocate(num_planets)
+
+    def _allocate(self, N):
+        """(Re)allocate all the buffers for N planets"""
+        self.num_planets = N
+        self.raw = np.zeros((N, 8), dtype=np.float64)  # The raw planet and transporter fields of the tick
+        self.scaled = np.zeros((N, 8), dtype=np.float64)  # The raw fields divided by their normalizers
+        self.scale = np.ones((8,), dtype=np.float64)  # The normalizer of each raw column
+        self.static_key = None  # The (params, player) the static columns were computed for, None after reset()
+        self.owner_codes = {}  # Owner feature of each Player
+        self.slot = np.zeros((N,), dtype=np.intp)  # Index into the incoming buffer for each transporter
+        self.tp_ships = np.zeros((N,), dtype=np.float32)  # Transporter ships in float32 like the original accumulation
+        self.incoming = np.zeros((2 * N + 1,), dtype=np.float32)  # [friendly | enemy | unused slot]
+        self.source = -1  # Our idle planet with the most ships in the last extracted state
+        self.M = np.zeros((N, self.NUM_FEATURES), dtype=np.float32)  # The output feature matrix
+
+    def reset(self):
+        """Forget the static columns, called when the agent starts a new game"""
+        self.static_key = None
+
+    def _prepare_static(self, planets, params, me):
+        """Compute the growth rate and position columns and the normalizers once per game"""
+        static = np.array([(p.growth_rate, p.position.x, p.position.y) for p in planets], dtype=np.float64).reshape(-1, 3)
+        static /= (float(params.max_growth_rate), params.width, params.height)
+        np.minimum(static[:, 0], 1.0, out=static[:, 0])
+        self.M[:, 2:5] = static  # growth, x, y (cast to float32), never overwritten during the game
+
+        speed = float(params.transporter_speed)
+        self.scale[self.SHIPS] = 200.0
+        self.scale[self.TP_SX:] = (params.width, params.height, speed, speed)
+        opponent = me.opponent()
+        self.owner_codes = {me: 1.0, opponent: -1.0, Player.Neutral: 0.0}
+        self.static_key = (params, me)
+
+    def _read_fields(self, planets, me):
+        """Read the per-tick fields of the planets and their transporters into the raw matrix"""
+        opponent = me.opponent()
+        codes = self.owner_codes
+        N = len(planets)
+        unused = 2 * N
+        values = []  # Flat row-major list of the raw fields, copied into the buffer at once
+        source, source_ships = -1, None  # Our idle planet with the most ships (the first one on ties)
+        for i, p in enumerate(planets):
+            tp = p.transporter
+            if tp is None:
+                owner = codes[p.owner]
+                values.extend((owner, p.n_ships, unused, 0.0, 0.0, 0.0, 0.0, 0.0))
+                if owner == 1.0 and (source < 0 or float(p.n_ships) > source_ships):
+                    source, source_ships = i, float(p.n_ships)
+            else:
+                # Slot of the transporter in the incoming buffer: [friendly | enemy | unused]
+                dest = tp.destination_index
+                slot = dest if tp.owner == me else (N + dest if tp.owner == opponent else unused)
+                values.extend((codes[p.owner], p.n_ships, slot, tp.n_ships, tp.s.x, tp.s.y, tp.v.x, tp.v.y))
+        self.raw.reshape(-1)[:] = values
+        self.source = source
+
+    def extract(self, state: GameState, params: GameParams, me: Player) -> np.ndarray:
+        """Build the (N, 11) feature matrix of the planets in the game state"""
+        planets = state.planets
+        N = len(planets)
+        if N != self.num_planets:
+            self._allocate(N)
+        if self.static_key is None or self.static_key[0] is not params or self.static_key[1] != me:
+            self._prepare_static(planets, params, me)
+        self._read_fields(planets, me)
+        raw, scaled, M = self.raw, self.scaled, self.M
+
+        # Incoming ships per destination. Each transporter is added to the friendly or enemy half
+        # of the buffer in planet order, planets without a player transporter add 0 to the unused slot.
+        np.copyto(self.slot, raw[:, self.TP_SLOT], casting="unsafe")
+        np.copyto(self.tp_ships, raw[:, self.TP_SHIPS], casting="unsafe")
+        self.incoming.fill(0.0)
+        np.add.at(self.incoming, self.slot, self.tp_ships)
+
+        # Normalize every column in float64, the owner and transporter bookkeeping columns are divided by 1
+        np.divide(raw, self.scale, out=scaled)
+        np.minimum(scaled[:, self.SHIPS], 1.0, out=scaled[:, self.SHIPS])
+
+        M[:, 0:2] = scaled[:, self.OWNER:self.SHIPS + 1]  # owner, ships (cast to float32)
+        np.divide(self.incoming[:2 * N].reshape(2, N), np.float32(200.0), out=M[:, 5:7].T)
+        np.minimum(M[:, 5:7], np.float32(1.0), out=M[:, 5:7])
+        M[:, 7:11] = scaled[:, self.TP_SX:]  # transporter position and velocity
+        return M
+
+    def largest_idle(self):
+        """Index of our idle planet with the most ships in the last extracted state (the first one on ties), -1 without idle planets"""
+        return self.source
+
+def make_network(input_dim, output_dim, hidden_sizes, backend="torch"):
+    """Create the network for the inference backend: 'torch', 'numpy' (float32) or 'numpy64' (float64)"""
+    if backend == "torch":
+        from torch_network import NeuralNetwork  # Only the torch backend pays for importing torch
+        return NeuralNetwork(input_dim, output_dim, hidden_sizes).eval()
+    if backend == "numpy":
+        return NumpyNetwork(input_dim, output_dim, hidden_sizes, dtype=np.float32)
+    if backend == "numpy64":
+        return NumpyNetwork(input_dim, output_dim, hidden_sizes, dtype=np.float64)
+    raise ValueError(f"Unknown inference backend: {backend}")
+
+class NeuralPlanetWarsAgent(PlanetWarsPlayer):
+    """A neural network agent for playing the Planet Wars game"""
+    def __init__(self, model):
+        """Initialize the neural network agent with the given model"""
+        super().__init__()
+        self.model = model.eval()
+        self.features = PlanetFeatureExtractor()  # Feature buffers reused across ticks
+
+    def prepare_to_play_as(self, *args, **kwargs):
+        """Bind the agent to a player and params for a new game, the static features are recomputed on its first tick"""
+        self.features.reset()
+        return super().prepare_to_play_as(*args, **kwargs)
+
+    def get_action(self, game_state):
+        """Get the next action using the game_state"""
+        M = self.features.extract(game_state, self.params, self.player)  # Get the feature matrix
+        flat_M = M.reshape(-1)  # Flatten the feature matrix (a view, no copy)
+
+        noop, logits, ratio = self.model.forward_outputs(flat_M)  # Pass it through the network
+        return self.choose_action(game_state, noop, logits, ratio)
+
+    def choose_action(self, game_state, noop, logits, ratio):
+        """Turn the network outputs for the game_state into an action.
+        The game_state must be the state the features were last extracted from."""
+        # Find the idle planet owned by us with the maximum number of ships. Idle planets can be used to send transporters.
+        source_idx = self.features.largest_idle()
+        if source_idx < 0:  # If there are no idle planets that are owned by us, then do nothing
+            return Action.do_nothing()
+
+        target_idx = int(np.argmax(logits))  # The ID of the target planet
+        if noop >= float(logits[target_idx]):  # If the noop logit is higher than the logit of the target planet
+            return Action.do_nothing()  # again do nothing
+
+        source_planet = game_state.planets[source_idx]
+        num_ships = int(float(source_planet.n_ships) * ratio)  # Determine the number of ships to send using the ratio
+        if num_ships <= 0:  # If it is less than or equal to 0, do nothing
+            return Action.do_nothing()
+        dest = game_state.planets[target_idx]  # Use the destination planet given by the game state
+        return Action(player_id=self.player,
+                      source_planet_id=source_planet.id,
+                      destination_planet_id=dest.id,
+                      num_ships=num_ships)
+
+    def get_agent_type(self) -> str:
+        return "evolved_nn"
+
+def profile_agent():
+    """Time the phases of the agent (features, inference, choose_action) in this process, see profiler.py"""
+    instrument(PlanetFeatureExtractor, "extract", "features")
+    network_classes = [NumpyNetwork]
+    if "torch_network" in sys.modules:  # The torch network is timed only if it is in use
+        network_classes.append(sys.modules["torch_network"].NeuralNetwork)
+    for network_cls in network_classes:
+        instrument(network_cls, "forward_outputs", "inference")
+        instrument(network_cls, "forward_batch", "inference")
+    instrument(NeuralPlanetWarsAgent, "choose_action", "choose_action")
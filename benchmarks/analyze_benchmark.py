@@ -1,25 +1,100 @@
+import argparse
+import json
+import math
 import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+import numpy as np
 import pandas as pd
-
-def analyze_file(csv_path):
-    df = pd.read_csv(csv_path)
-
-    # Win counts
-    winners = df["winner"].value_counts().to_dict()
-    total_games = int(df.shape[0])
-
-    metrics = ["p1_planets", "p2_planets", "neutral_planets", "p1_ships", "p2_ships"]  # Other metrics
-    stats = {}
-    for col in metrics:
-        series = df[col]
-        stats[col] = (series.mean(), series.std(ddof=1))  # Calculate the mean and st.dev.
-
-    return winners, stats, total_games
-
-def format_report(csv_path, winners, stats, total_games):
+from columnar import COLUMNS_SUFFIX, read_columns
+
+METRICS = ["p1_planets", "p2_planets", "neutral_planets", "p1_ships", "p2_ships"]
+CHUNK_ROWS = 200000  # Rows read at a time, the memory use does not grow with the file
+CACHE_FILE = ".analysis_cache.json"  # Summaries of the analyzed files, keyed by path
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Summarize the benchmark results in the benchmarks/ folder.")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the win rate intervals (default: 0.95)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of files analyzed in parallel (default: number of cores)")
+    return parser.parse_args()
+
+class RunningStats:
+    """Welford accumulator of the count, mean and sum of squared deviations, updated chunk by chunk"""
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count, self.mean, self.m2 = int(count), float(mean), float(m2)
+
+    def update(self, values):
+        """Merge the statistics of a chunk of values (Chan et al. parallel update)"""
+        values = np.asarray(values, dtype=np.float64)
+        n = values.size
+        if n == 0:
+            return
+        chunk_mean = float(values.mean())
+        chunk_m2 = float(np.square(values - chunk_mean).sum())
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + delta * delta * self.count * n / total
+        self.count = total
+
+    def std(self):
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else float("nan")
+
+def result_chunks(path):
+    """Yield the results in chunks of at most CHUNK_ROWS rows as (winner labels, {metric: values})"""
+    if path.endswith(COLUMNS_SUFFIX):  # Results in the columnar format, memory-mapped
+        columns, labels = read_columns(path)
+        labels = np.asarray(labels, dtype=object)
+        for start in range(0, len(columns["winner"]), CHUNK_ROWS):
+            stop = start + CHUNK_ROWS
+            yield labels[columns["winner"][start:stop]], {col: columns[col][start:stop] for col in METRICS}
+        return
+    for df in pd.read_csv(path, usecols=["winner"] + METRICS, chunksize=CHUNK_ROWS):
+        yield df["winner"].to_numpy(), {col: df[col].to_numpy() for col in METRICS}
+
+def analyze_file(path):
+    """Win counts and the running statistics of the metrics in a single pass over the file"""
+    winners = {}
+    stats = {col: RunningStats() for col in METRICS}
+    for chunk_winners, chunk_metrics in result_chunks(path):
+        labels, counts = np.unique(chunk_winners, return_counts=True)
+        for label, count in zip(labels, counts):
+            winners[str(label)] = winners.get(str(label), 0) + int(count)
+        for col in METRICS:
+            stats[col].update(chunk_metrics[col])
+    total_games = sum(winners.values())
+    return {"winners": winners, "stats": {col: [s.count, s.mean, s.m2] for col, s in stats.items()}, "total_games": total_games}
+
+def file_key(path):
+    """Size and modification time of a result file or column directory, a changed key means the results changed"""
+    if os.path.isdir(path):
+        entries = [os.stat(os.path.join(path, name)) for name in sorted(os.listdir(path))]
+    else:
+        entries = [os.stat(path)]
+    return [sum(e.st_size for e in entries), max((e.st_mtime_ns for e in entries), default=0)]
+
+def load_cache(cache_path):
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):  # No cache yet, or an unreadable one that is rebuilt
+        return {}
+
+def wilson_bounds(wins, games, z):
+    """Wilson score interval of a win rate, [0, 1] without games"""
+    if games <= 0:
+        return 0.0, 1.0
+    p = wins / games
+    denom = 1.0 + z * z / games
+    center = (p + z * z / (2.0 * games)) / denom
+    half = z * math.sqrt(p * (1.0 - p) / games + z * z / (4.0 * games * games)) / denom
+    return max(center - half, 0.0), min(center + half, 1.0)
+
+def format_report(path, summary, confidence):
     lines = []
+    winners, total_games = summary["winners"], summary["total_games"]
 
-    filename = os.path.basename(csv_path)
+    filename = os.path.basename(path)
     stem, _ = os.path.splitext(filename)
     base = stem[: -len("_benchmark")]
     parts = base.split("_v_", 1)
@@ -34,10 +109,12 @@ def format_report(csv_path, winners, stats, total_games):
     lines.append(f"Total games: {total_games}")
     lines.append("")
 
-    lines.append("Win counts:")
+    lines.append(f"Win counts ({confidence * 100:.0f}% Wilson interval of the win rate):")
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
     for winner, count in sorted(winners.items(), key=lambda x: (-x[1], x[0])):
         pct = (count / total_games * 100.0) if total_games > 0 else 0.0
-        lines.append(f"{winner:20s} {count:8d} ({pct:6.2f}%)")
+        lower, upper = wilson_bounds(count, total_games, z)
+        lines.append(f"{winner:20s} {count:8d} ({pct:6.2f}%)  [{lower * 100:6.2f}%, {upper * 100:6.2f}%]")
 
     lines.append("")
 
@@ -46,31 +123,44 @@ def format_report(csv_path, winners, stats, total_games):
     lines.append(header)
     lines.append("-" * len(header))
 
-    metric_order = ["p1_planets", "p2_planets", "neutral_planets", "p1_ships", "p2_ships"]
-
-    for metric in metric_order:
-        mean, stdev = stats.get(metric, (float("nan"), float("nan")))
-        lines.append(f"{metric:20s} {mean:12.3f} {stdev:12.3f}")
+    for metric in METRICS:
+        stats = RunningStats(*summary["stats"][metric])
+        mean = stats.mean if stats.count > 0 else float("nan")
+        lines.append(f"{metric:20s} {mean:12.3f} {stats.std():12.3f}")
 
     lines.append("")
     return "\n".join(lines)
 
 
 def main():
+    args = parse_args()
     base_dir = os.path.dirname(os.path.abspath(__file__))
 
-    # Get all the benchmark results
-    csv_files = [os.path.join(base_dir, name) for name in os.listdir(base_dir) if name.endswith("_benchmark.csv")]
+    # Get all the benchmark results, in either format
+    result_files = [os.path.join(base_dir, name) for name in os.listdir(base_dir) if name.endswith(("_benchmark.csv", COLUMNS_SUFFIX))]
 
-    if not csv_files:
-        print("No *_benchmark.csv files found to analyze.")
+    if not result_files:
+        print(f"No *_benchmark.csv files or *{COLUMNS_SUFFIX} directories found to analyze.")
         return
 
-    for csv_path in csv_files:  # For each csv file
-        winners, stats, total_games = analyze_file(csv_path)  # Run analysis
-        report = format_report(csv_path, winners, stats, total_games)  # Create report
+    # Only the files that changed since their cached summary are analyzed again
+    cache_path = os.path.join(base_dir, CACHE_FILE)
+    cache = load_cache(cache_path)
+    keys = {path: file_key(path) for path in result_files}
+    stale = [path for path in result_files if cache.get(os.path.basename(path), {}).get("key") != keys[path]]
+    print(f"{len(result_files)} result files, {len(stale)} to analyze")
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(stale)))) as executor:
+            for path, summary in zip(stale, executor.map(analyze_file, stale)):
+                cache[os.path.basename(path)] = {"key": keys[path], "summary": summary}
+        with open(cache_path, "w") as f:
+            json.dump(cache, f)
+
+    for path in result_files:  # For each result file
+        report = format_report(path, cache[os.path.basename(path)]["summary"], args.confidence)  # Create report
 
-        filename = os.path.basename(csv_path)
+        filename = os.path.basename(path)
         stem, _ = os.path.splitext(filename)
         out_name = f"{stem}_analysis.txt"
         out_path = os.path.join(base_dir, out_name)
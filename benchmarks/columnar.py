@@ -0,0 +1,94 @@
+"""Columnar binary storage of benchmark results: one raw typed file per column and a JSON schema.
+
+A result set is a directory <name>_benchmark.cols holding columns.json and a <column>.bin file per
+column. Rows are appended chunk by chunk and the columns can be read back as memory-mapped arrays.
+The winner is stored as a code into the "winners" labels of the schema.
+"""
+
+import sys
+import csv
+import json
+import os
+import numpy as np
+
+COLUMNS_SUFFIX = "_benchmark.cols"
+SCHEMA_FILE = "columns.json"
+# Column name and dtype, in the order of the CSV columns
+COLUMNS = [
+    ("game", "<u4"),
+    ("winner", "u1"),
+    ("p1_planets", "<u2"),
+    ("p2_planets", "<u2"),
+    ("neutral_planets", "<u2"),
+    ("p1_ships", "<f4"),
+    ("p2_ships", "<f4"),
+]
+
+class ColumnarWriter:
+    """Appends rows of benchmark results to the column files of a result directory"""
+    def __init__(self, path, winners):
+        self.path = path
+        self.winners = list(winners)  # Labels of the winner codes
+        self.codes = {label: code for code, label in enumerate(self.winners)}
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, SCHEMA_FILE), "w") as f:
+            json.dump({"columns": [[name, dtype] for name, dtype in COLUMNS], "winners": self.winners}, f, indent=2)
+        self.files = {name: open(os.path.join(path, f"{name}.bin"), "ab") for name, _ in COLUMNS}
+
+    def writerows(self, rows):
+        """Append the CSV-style rows [game, winner, p1_planets, p2_planets, neutral_planets, p1_ships, p2_ships]"""
+        if not rows:
+            return
+        fields = list(zip(*rows))
+        fields[1] = [self.codes[w] for w in fields[1]]
+        for (name, dtype), values in zip(COLUMNS, fields):
+            self.files[name].write(np.asarray(values, dtype=dtype).tobytes())
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_columns(path):
+    """Memory-map the columns of a result directory, returns ({name: array}, winner labels)"""
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        schema = json.load(f)
+    columns = {}
+    n_rows = None
+    for name, dtype in schema["columns"]:
+        file_path = os.path.join(path, f"{name}.bin")
+        n = os.path.getsize(file_path) // np.dtype(dtype).itemsize
+        n_rows = n if n_rows is None else min(n_rows, n)  # An interrupted append leaves a partial last row
+        columns[name] = (file_path, dtype)
+    arrays = {}
+    for name, (file_path, dtype) in columns.items():
+        arrays[name] = np.memmap(file_path, dtype=dtype, mode="r", shape=(n_rows,)) if n_rows else np.zeros((0,), dtype=dtype)
+    return arrays, schema["winners"]
+
+def export_csv(path, csv_path, chunk_rows=100000):
+    """Write the results of a column directory to a CSV file in the format of run_benchmark.py"""
+    columns, winners = read_columns(path)
+    names = [name for name, _ in COLUMNS]
+    labels = np.asarray(winners, dtype=object)
+    n_rows = len(columns["game"])
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for start in range(0, n_rows, chunk_rows):
+            stop = min(start + chunk_rows, n_rows)
+            chunk = [columns[name][start:stop].tolist() for name in names]
+            chunk[1] = labels[columns["winner"][start:stop]].tolist()
+            writer.writerows(zip(*chunk))
+
+if __name__ == "__main__":
+    # Export the given column directories to CSV files next to them
+    for path in sys.argv[1:]:
+        path = path.rstrip(os.sep)
+        csv_path = path[: -len(COLUMNS_SUFFIX)] + "_benchmark.csv"
+        export_csv(path, csv_path)
+        print(f"{path} -> {csv_path}")
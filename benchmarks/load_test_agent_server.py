@@ -0,0 +1,93 @@
+"""Load test of sharp_agent_server.py: plays N concurrent games locally against the server.
+
+Every simulated game runs the forward model and the opponent in this process and asks the server for
+the actions of Player 1 over its own websocket connection, like the Kotlin RemoteAgent does.
+"""
+
+import sys
+import argparse
+import asyncio
+import json
+import os
+import time
+import numpy as np
+import websockets
+
+# Ensure Planet Wars Python bindings are on the path
+PW_PYTHON_PATH = "planet-wars-rts/app/src/main/python"
+if PW_PYTHON_PATH not in sys.path:
+    sys.path.insert(0, PW_PYTHON_PATH)
+
+# Ensure project root is on the path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from client_server.util import serialize_result  # type: ignore
+from core.forward_model import ForwardModel  # type: ignore
+from core.game_state import Action, GameParams, Player  # type: ignore
+from core.game_state_factory import GameStateFactory  # type: ignore
+from run_benchmark import make_agent
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulate concurrent remote games against sharp_agent_server.py.")
+    parser.add_argument("--url", type=str, default="ws://localhost:8765", help="Address of the agent server (default: ws://localhost:8765)")
+    parser.add_argument("--games", type=int, default=64, help="Number of concurrent games (default: 64)")
+    parser.add_argument("--rounds", type=int, default=1, help="Games played one after another on every connection (default: 1)")
+    parser.add_argument("--opponent", type=str, choices=["pure", "careful", "greedy"], default="greedy", help="Local opponent of the served agent (default: greedy)")
+    parser.add_argument("--num-planets", type=int, default=12, help="Number of planets in the map (default: 12)")
+    return parser.parse_args()
+
+async def call(websocket, request):
+    """Send one request and return the result of its response"""
+    await websocket.send(json.dumps(request))
+    response = json.loads(await websocket.recv())
+    if response.get("status") != "ok":
+        raise RuntimeError(f"Server error: {response.get('error')}")
+    return response.get("result")
+
+async def play_game(websocket, opponent_kind, num_planets, latencies):
+    """Play one game with the served agent as Player 1, returns the winner"""
+    params = GameParams(num_planets=num_planets)
+    game = ForwardModel(GameStateFactory(params).create_game(), params)
+    opponent = make_agent(opponent_kind)
+    opponent.prepare_to_play_as(Player.Player2, params)
+
+    object_id = (await call(websocket, {"requestType": "init", "className": "SharpAgent"}))["objectId"]
+    invoke = lambda method, args: {"requestType": "invoke", "objectId": object_id, "method": method, "args": args}
+    await call(websocket, invoke("prepareToPlayAs", [serialize_result(Player.Player1), serialize_result(params)]))
+    while not game.is_terminal():
+        start = time.perf_counter()
+        result = await call(websocket, invoke("getAction", [serialize_result(game.state)]))
+        latencies.append(time.perf_counter() - start)
+        p1_action = Action.model_validate(result)
+        p2_action = opponent.get_action(game.state.model_copy(deep=True))
+        game.step({Player.Player1: p1_action, Player.Player2: p2_action})
+    await call(websocket, {"requestType": "end", "objectId": object_id})
+    return game.get_leader()
+
+async def run_connection(args, latencies, winners):
+    async with websockets.connect(args.url, max_size=None) as websocket:
+        for _ in range(args.rounds):
+            winners.append(await play_game(websocket, args.opponent, args.num_planets, latencies))
+
+async def main():
+    args = parse_args()
+    latencies, winners = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_connection(args, latencies, winners) for _ in range(args.games)))
+    elapsed = time.perf_counter() - start
+
+    ms = np.asarray(latencies) * 1000.0
+    print(f"Games: {len(winners)} ({args.games} concurrent), actions: {ms.size}, time: {elapsed:.2f}s")
+    print(f"Throughput: {ms.size / elapsed:.1f} actions/s, {len(winners) / elapsed:.2f} games/s")
+    print(f"Round-trip latency: p50={np.percentile(ms, 50):.2f}ms  p90={np.percentile(ms, 90):.2f}ms  p99={np.percentile(ms, 99):.2f}ms")
+    print(f"Served agent wins: {sum(1 for w in winners if w == Player.Player1)}/{len(winners)}")
+    async with websockets.connect(args.url) as websocket:  # The counters of the server
+        try:
+            print("Server stats:", json.dumps(await call(websocket, {"requestType": "stats"}), indent=2))
+        except RuntimeError as e:  # A server without batching does not know the stats request
+            print(e)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,274 @@
+"""Timing benchmarks for the hot paths of the agent, the features, the inference and the game loop.
+
+Every benchmark runs with fixed seeds, a few warmup rounds and repeated timed rounds, and reports
+the percentiles of the time per operation. The results can be saved to a JSON file and compared
+against a stored baseline, which flags the benchmarks that became slower.
+"""
+
+import sys
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime
+import numpy as np
+import torch
+
+# Ensure Planet Wars Python bindings are on the path
+PW_PYTHON_PATH = "planet-wars-rts/app/src/main/python"
+if PW_PYTHON_PATH not in sys.path:
+    sys.path.insert(0, PW_PYTHON_PATH)
+
+# Ensure project root is on the path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from core.game_runner import GameRunner  # type: ignore
+from core.game_state import GameParams, Player  # type: ignore
+from agents.random_agents import CarefulRandomAgent  # type: ignore
+from agents.greedy_heuristic_agent import GreedyHeuristicAgent  # type: ignore
+from train_nn import NeuralPlanetWarsAgent, PlanetFeatureExtractor, build_planet_matrix, evalute_individual, make_network, start_game
+from run_benchmark import make_agent
+
+PERCENTILES = [50, 90, 99]
+OPPONENT = "agents.greedy_heuristic_agent.GreedyHeuristicAgent"
+
+# Timed in a fresh interpreter, prints the seconds and the peak RSS in KiB
+STARTUP_SCRIPT = (
+    "import resource, time\n"
+    "start = time.perf_counter()\n"
+    "{code}\n"
+    "print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+)
+STARTUP_CASES = {
+    "startup/train_nn": "import train_nn",  # What loading SharpAgent cost while sharp_agent.py imported train_nn
+    "startup/sharp_agent": "import sharp_agent",
+    "startup/sharp_agent_load": "from sharp_agent import SharpAgent; SharpAgent()",
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time the hot paths of training and match runs, and compare them against a baseline.")
+    parser.add_argument("--only", type=str, default="", help="Comma separated benchmark name prefixes to run (default: all)")
+    parser.add_argument("--repeats", type=int, default=30, help="Timed rounds of every benchmark (default: 30)")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed rounds before the timed ones (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the maps, agents and networks (default: 0)")
+    parser.add_argument("--num-planets", type=int, default=12, help="Number of planets in the map (default: 12)")
+    parser.add_argument("--hidden-sizes", type=int, nargs="+", default=[32, 16, 8], help="Hidden layer sizes of the network (default: 32 16 8)")
+    parser.add_argument("--pairings", type=str, default="sharp:greedy,greedy:greedy,careful:greedy", help="Agent pairings of the full game benchmarks (default: sharp:greedy,greedy:greedy,careful:greedy)")
+    parser.add_argument("--eval-games", type=int, default=20, help="Games per evalute_individual call (default: 20)")
+    parser.add_argument("--out", type=str, help="Save the results to this JSON file")
+    parser.add_argument("--compare", type=str, help="Baseline JSON file to compare the results against")
+    parser.add_argument("--current", type=str, help="Compare this results file instead of running the benchmarks")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown of the median that counts as a regression (default: 0.10)")
+    return parser.parse_args()
+
+def seed_everything(seed):
+    """Seed the RNGs that the map generator, the agents and the networks draw from"""
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+def time_rounds(fn, repeats, warmup, ops_per_round=1):
+    """Call fn warmup + repeats times and return the per-operation time of every timed round"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) / ops_per_round)
+    return samples
+
+def summarize(samples, unit):
+    """Percentiles and the mean of the timed rounds"""
+    samples = np.asarray(samples, dtype=np.float64)
+    summary = {"unit": unit, "rounds": int(samples.size), "mean": float(samples.mean()), "min": float(samples.min())}
+    for q in PERCENTILES:
+        summary[f"p{q}"] = float(np.percentile(samples, q))
+    summary["ops_per_s"] = 1.0 / summary["p50"] if summary["p50"] > 0 else float("inf")
+    return summary
+
+def sample_states(num_planets, seed, n_states=200):
+    """Deep copies of the states of a seeded greedy vs careful game, used as the inputs of the per-call benchmarks"""
+    seed_everything(seed)
+    params = GameParams(num_planets=num_planets)
+    agent1, agent2 = GreedyHeuristicAgent(), CarefulRandomAgent()
+    game = start_game(agent1, agent2, params)
+    states = []
+    while not game.is_terminal() and len(states) < n_states:
+        states.append(game.state.model_copy(deep=True))
+        p1_action = agent1.get_action(game.state.model_copy(deep=True))
+        p2_action = agent2.get_action(game.state.model_copy(deep=True))
+        game.step({Player.Player1: p1_action, Player.Player2: p2_action})
+    return params, states
+
+def seeded_network(args, backend):
+    """A network of the benchmark size with seeded random weights"""
+    input_dim = args.num_planets * PlanetFeatureExtractor.NUM_FEATURES
+    model = make_network(input_dim, args.num_planets + 2, args.hidden_sizes, backend)
+    rng = np.random.default_rng(args.seed)
+    model.set_model_weights(rng.normal(0.0, 0.5, size=model.get_model_weights().size))
+    return model
+
+def bench_features(args, params, states):
+    results = {}
+    extractor = PlanetFeatureExtractor()
+    per_call = {
+        "features/build_planet_matrix": lambda: [build_planet_matrix(s, params, Player.Player1) for s in states],
+        "features/extractor": lambda: [extractor.extract(s, params, Player.Player1) for s in states],
+    }
+    for name, fn in per_call.items():
+        results[name] = summarize(time_rounds(fn, args.repeats, args.warmup, len(states)), "s/call")
+    return results
+
+def bench_forward(args, params, states):
+    results = {}
+    inputs = [build_planet_matrix(s, params, Player.Player1).reshape(-1) for s in states]
+    for backend in ("torch", "numpy", "numpy64"):
+        model = seeded_network(args, backend)
+        fn = lambda: [model.forward_outputs(x) for x in inputs]
+        results[f"forward/{backend}"] = summarize(time_rounds(fn, args.repeats, args.warmup, len(inputs)), "s/call")
+    return results
+
+def bench_get_action(args, params, states):
+    results = {}
+    for backend in ("torch", "numpy"):
+        agent = NeuralPlanetWarsAgent(seeded_network(args, backend))
+        agent.prepare_to_play_as(Player.Player1, params)
+        fn = lambda: [agent.get_action(s) for s in states]
+        results[f"get_action/{backend}"] = summarize(time_rounds(fn, args.repeats, args.warmup, len(states)), "s/tick")
+    return results
+
+def bench_games(args):
+    results = {}
+    for pairing in args.pairings.split(","):
+        kind1, kind2 = pairing.split(":")
+        rounds = iter(range(args.warmup + args.repeats))
+        def play():
+            seed_everything(args.seed + next(rounds))  # The same sequence of maps in every run
+            GameRunner(make_agent(kind1), make_agent(kind2), GameParams(num_planets=args.num_planets)).run_game()
+        results[f"game/{kind1}_v_{kind2}"] = summarize(time_rounds(play, args.repeats, args.warmup), "s/game")
+    return results
+
+def bench_evaluate(args):
+    results = {}
+    input_dim = args.num_planets * PlanetFeatureExtractor.NUM_FEATURES
+    theta = seeded_network(args, "numpy").get_model_weights()
+    repeats = max(1, args.repeats // 10)  # Every round plays eval_games full games
+    for backend in ("torch", "numpy"):
+        for concurrent_games in (1, 8):
+            task = (theta, input_dim, args.num_planets + 2, args.num_planets, args.eval_games, OPPONENT, list(args.hidden_sizes), concurrent_games, backend)
+            def evaluate():
+                seed_everything(args.seed)
+                evalute_individual(task)
+            samples = time_rounds(evaluate, repeats, min(args.warmup, 1), args.eval_games)
+            results[f"evaluate/{backend}_c{concurrent_games}"] = summarize(samples, "s/game")  # One process, so games/s per core
+    return results
+
+def bench_startup(args):
+    """Import time and peak RSS of the agent modules, every round in a new interpreter so that nothing is imported yet"""
+    results = {}
+    repeats = max(3, args.repeats // 10)
+    for name, code in STARTUP_CASES.items():
+        samples, rss = [], []
+        for i in range(min(args.warmup, 1) + repeats):  # The first round fills the file cache
+            out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT.format(code=code)], cwd=PROJECT_ROOT,
+                                 capture_output=True, text=True, check=True)
+            seconds, maxrss = out.stdout.split()[-2:]
+            if i >= min(args.warmup, 1):
+                samples.append(float(seconds))
+                rss.append(float(maxrss) / 1024.0)
+        results[name] = summarize(samples, "s/start")
+        results[name]["rss_mb"] = float(np.median(rss))
+    return results
+
+def run_benchmarks(args):
+    selected = [p for p in args.only.split(",") if p]
+    wanted = lambda group: not selected or any(group.startswith(p) or p.startswith(group) for p in selected)
+    params, states = sample_states(args.num_planets, args.seed)
+    torch.set_num_threads(1)  # Per-core numbers, like the training workers
+
+    results = {}
+    if wanted("startup"):
+        results.update(bench_startup(args))
+    if wanted("features"):
+        results.update(bench_features(args, params, states))
+    if wanted("forward"):
+        results.update(bench_forward(args, params, states))
+    if wanted("get_action"):
+        results.update(bench_get_action(args, params, states))
+    if wanted("game"):
+        results.update(bench_games(args))
+    if wanted("evaluate"):
+        results.update(bench_evaluate(args))
+    if selected:
+        results = {name: r for name, r in results.items() if any(name.startswith(p) for p in selected)}
+    return results
+
+def compare(results, baseline, threshold):
+    """Compare the medians against the baseline, returns the report lines and the names of the regressions"""
+    lines = [f"{'Benchmark':32s} {'Baseline p50':>14s} {'Current p50':>14s} {'Change':>9s}"]
+    lines.append("-" * len(lines[0]))
+    regressions = []
+    for name in sorted(set(results) | set(baseline)):
+        if name not in results or name not in baseline:
+            lines.append(f"{name:32s} {'(only in ' + ('baseline' if name in baseline else 'current') + ')':>39s}")
+            continue
+        old, new = baseline[name]["p50"], results[name]["p50"]
+        change = new / old - 1.0 if old > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        lines.append(f"{name:32s} {old:14.3e} {new:14.3e} {change * 100:+8.1f}%{flag}")
+    return lines, regressions
+
+def format_results(results):
+    header = f"{'Benchmark':32s} {'p50':>12s} {'p90':>12s} {'p99':>12s} {'ops/s':>12s}  unit"
+    lines = [header, "-" * len(header)]
+    for name, r in results.items():
+        rss = f"  (peak RSS {r['rss_mb']:.0f} MB)" if "rss_mb" in r else ""
+        lines.append(f"{name:32s} {r['p50']:12.3e} {r['p90']:12.3e} {r['p99']:12.3e} {r['ops_per_s']:12.1f}  {r['unit']}{rss}")
+    return lines
+
+def main():
+    args = parse_args()
+
+    if args.current is not None:
+        with open(args.current) as f:
+            results = json.load(f)["benchmarks"]
+    else:
+        results = run_benchmarks(args)
+        print("\n".join(format_results(results)))
+
+    if args.out is not None:
+        report = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+                        "numpy": np.__version__, "torch": torch.__version__},
+            "settings": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "current")},
+            "benchmarks": results,
+        }
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.out}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)["benchmarks"]
+        lines, regressions = compare(results, baseline, args.threshold)
+        print("=" * 50)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold * 100:.0f}%: {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions")
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import argparse
 import csv
 import os
 import time
+from contextlib import ExitStack
 from datetime import datetime
 from concurrent.futures import ProcessPoolExecutor
 
@@ -21,6 +22,12 @@ from core.game_state import GameParams, Player  # type: ignore
 from agents.random_agents import PureRandomAgent, CarefulRandomAgent  # type: ignore
 from agents.greedy_heuristic_agent import GreedyHeuristicAgent  # type: ignore
 from sharp_agent import SharpAgent
+from columnar import COLUMNS_SUFFIX, ColumnarWriter
+
+# Progress lines are printed at most this often (seconds)
+PROGRESS_INTERVAL = 1.0
+# Labels of the winner codes in the columnar format
+WINNERS = [str(Player.Neutral), str(Player.Player1), str(Player.Player2)]
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Run benchmark games between agents and save results to CSV.")
@@ -28,6 +35,9 @@ def parse_args():
     parser.add_argument("--agent2", type=str, choices=["pure", "careful", "greedy", "sharp"], default="greedy", help="Type of agent 2: 'pure', 'careful', 'greedy', or 'sharp' (default: greedy).")
     parser.add_argument("--n-games", type=int, default=100000, help="Number of games to run (default: 100000)")
     parser.add_argument("--num-planets", type=int, default=12, help="Number of planets in the map (default: 12)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes (default: number of cores)")
+    parser.add_argument("--chunk-size", type=int, default=0, help="Games per dispatched job, 0 picks it from the games per worker (default: 0)")
+    parser.add_argument("--format", type=str, choices=["csv", "columnar"], default="csv", help="Output format: a CSV file, or typed binary columns in a .cols directory (default: csv)")
     return parser.parse_args()
 
 def make_agent(kind: str):
@@ -42,16 +52,20 @@ def make_agent(kind: str):
     raise ValueError(f"Unknown agent type: {kind}")
 
 
-def run_single_game(job):
-    """Run a single game and return the CSV row data."""
-    game_index, agent1_kind, agent2_kind, num_planets = job
+# Per-process state of a benchmark worker, filled in by init_worker
+_WORKER = {}
 
+def init_worker(agent1_kind, agent2_kind, num_planets):
+    """Build both agents and the game runner once per worker process, they are reused for every game"""
     agent1 = make_agent(agent1_kind)
     agent2 = make_agent(agent2_kind)
-    game_params = GameParams(num_planets=num_planets)
-    runner = GameRunner(agent1, agent2, game_params)
+    if "torch" in sys.modules:  # Only the agents with the torch backend import torch
+        sys.modules["torch"].set_num_threads(1)  # Every worker plays on its own core
+    _WORKER["runner"] = GameRunner(agent1, agent2, GameParams(num_planets=num_planets))
 
-    final_model = runner.run_game()
+def run_single_game(game_index):
+    """Run a single game with the worker's agents and return the CSV row data."""
+    final_model = _WORKER["runner"].run_game()
     winner = final_model.get_leader()
 
     planets = final_model.state.planets
@@ -64,34 +78,57 @@ def run_single_game(job):
 
     return [game_index, str(winner), p1_planets, p2_planets, neutral_planets, p1_ships, p2_ships]
 
+def run_game_chunk(chunk):
+    """Run the games [start, stop) and return their CSV rows"""
+    start, stop = chunk
+    return [run_single_game(i) for i in range(start, stop)]
+
+def chunk_size(n_games, n_workers):
+    """Games per job: about 16 jobs per worker to balance the load, with at most 500 games between two results"""
+    return max(1, min(500, n_games // (n_workers * 16)))
+
+def game_chunks(n_games, size):
+    """The [start, stop) ranges of game indices (1-based) of every job"""
+    return [(start, min(start + size, n_games + 1)) for start in range(1, n_games + 1, size)]
+
 def main():
     args = parse_args()
 
-    # Fixed number of worker processes
-    n_workers = max(1, min(12, args.n_games))
+    n_workers = max(1, min(args.workers, args.n_games))
+    size = args.chunk_size if args.chunk_size > 0 else chunk_size(args.n_games, n_workers)
 
     print(f"Benchmark: {args.agent1} vs {args.agent2}")
     print(f"Games: {args.n_games}, Num planets: {args.num_planets}")
-    print(f"Using {n_workers} worker processes")
+    print(f"Using {n_workers} worker processes, {size} games per job")
     print("=" * 50)
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    outfile = f"{timestamp}_{args.agent1}_v_{args.agent2}_benchmark.csv"
+    suffix = COLUMNS_SUFFIX if args.format == "columnar" else "_benchmark.csv"
+    outfile = f"{timestamp}_{args.agent1}_v_{args.agent2}{suffix}"
     if not os.path.isabs(outfile):
         outfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), outfile)
 
     start_time = time.time()
 
-    with open(outfile, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["game", "winner", "p1_planets", "p2_planets", "neutral_planets", "p1_ships", "p2_ships"])
-
-        jobs = ((i, args.agent1, args.agent2, args.num_planets) for i in range(1, args.n_games + 1))
-
-        with ProcessPoolExecutor(max_workers=n_workers) as executor:
-            for completed, row in enumerate(executor.map(run_single_game, jobs), start=1):
-                writer.writerow(row)
-                print(f"Completed {completed}/{args.n_games} games")
+    with ExitStack() as stack:
+        if args.format == "columnar":  # Every chunk of rows is appended to the column files
+            writer = stack.enter_context(ColumnarWriter(outfile, WINNERS))
+        else:
+            f = stack.enter_context(open(outfile, "w", newline=""))
+            writer = csv.writer(f)
+            writer.writerow(["game", "winner", "p1_planets", "p2_planets", "neutral_planets", "p1_ships", "p2_ships"])
+
+        completed = 0
+        last_report = time.time()
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker,
+                                 initargs=(args.agent1, args.agent2, args.num_planets)) as executor:
+            for rows in executor.map(run_game_chunk, game_chunks(args.n_games, size)):
+                writer.writerows(rows)
+                completed += len(rows)
+                if time.time() - last_report >= PROGRESS_INTERVAL or completed == args.n_games:
+                    elapsed = time.time() - start_time
+                    print(f"Completed {completed}/{args.n_games} games ({completed / elapsed:.1f} games/s)")
+                    last_report = time.time()
 
     time_diff = time.time() - start_time
 
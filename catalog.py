@@ -0,0 +1,145 @@
+"""Cross-run catalog of the elite individuals of the training databases.
+
+The catalog keeps the top-K individuals of every run and of every generation, with the config of
+the run and a pointer (database, results rowid) to the solution. A database is indexed again only
+when its size or modification time changed since it was last indexed.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sqlite3
+from results_db import read_config
+
+CATALOG_FILE = "catalog.db"  # Not *.sqlite3, so that the catalog is not taken for a run database
+TOP_K = 10
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)",
+    "CREATE TABLE IF NOT EXISTS runs (db TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, generations INTEGER, config TEXT)",
+    # scope is 'run' for the top-K of the whole run and 'generation' for the top-K of every generation
+    "CREATE TABLE IF NOT EXISTS elites (db TEXT, scope TEXT, generation INTEGER, individual INTEGER, fitness REAL, result_rowid INTEGER)",
+    "CREATE INDEX IF NOT EXISTS elites_scope_fitness ON elites (scope, fitness)",
+    "CREATE INDEX IF NOT EXISTS elites_db_generation ON elites (db, scope, generation, fitness)",
+]
+
+def catalog_path(db_folder):
+    return os.path.join(db_folder, CATALOG_FILE)
+
+def open_catalog(path, top_k=TOP_K):
+    """Open (or create) the catalog, a catalog built with another top_k is emptied and rebuilt"""
+    conn = sqlite3.connect(path)
+    for statement in SCHEMA:
+        conn.execute(statement)
+    row = conn.execute("SELECT v FROM meta WHERE k = 'top_k'").fetchone()
+    if row is None or int(row[0]) != top_k:
+        with conn:
+            conn.execute("DELETE FROM runs")
+            conn.execute("DELETE FROM elites")
+            conn.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('top_k', ?)", (str(top_k),))
+    conn.commit()
+    return conn
+
+def file_key(db_path):
+    """Size and modification time of a run database, including its WAL file of a run in progress"""
+    size, mtime_ns = 0, 0
+    for path in (db_path, db_path + "-wal"):
+        if os.path.exists(path):
+            st = os.stat(path)
+            size += st.st_size
+            mtime_ns = max(mtime_ns, st.st_mtime_ns)
+    return size, mtime_ns
+
+def index_run(cat, db_path, top_k):
+    """Replace the catalog entries of a run database with its current top-K individuals"""
+    db = os.path.abspath(db_path)
+    if os.path.exists(db + "-wal"):
+        # A run in progress (or one that was interrupted). A read-write connection merges the WAL into the
+        # database when it is the last one to close, so no -wal/-shm files are left behind for finished runs.
+        conn = sqlite3.connect(db)
+    else:
+        # A finished run, read without any locking or shared-memory files. Queries never touch the solution BLOBs.
+        conn = sqlite3.connect(f"file:{db}?immutable=1", uri=True)
+    try:
+        cfg = read_config(conn)
+        run_rows = conn.execute(
+            "SELECT generation, individual, fitness, rowid FROM results ORDER BY fitness DESC LIMIT ?", (top_k,)
+        ).fetchall()
+        generation_rows = conn.execute(
+            "SELECT generation, individual, fitness, rowid FROM ("
+            "  SELECT generation, individual, fitness, rowid, "
+            "         ROW_NUMBER() OVER (PARTITION BY generation ORDER BY fitness DESC) AS rank FROM results"
+            ") WHERE rank <= ?", (top_k,)
+        ).fetchall()
+        (generations,) = conn.execute("SELECT COUNT(DISTINCT generation) FROM results").fetchone()
+    finally:
+        conn.close()
+
+    size, mtime_ns = file_key(db_path)  # After the close, which may have merged the WAL
+    with cat:
+        cat.execute("DELETE FROM elites WHERE db = ?", (db,))
+        cat.executemany("INSERT INTO elites (db, scope, generation, individual, fitness, result_rowid) VALUES (?, 'run', ?, ?, ?, ?)",
+                        [(db,) + tuple(r) for r in run_rows])
+        cat.executemany("INSERT INTO elites (db, scope, generation, individual, fitness, result_rowid) VALUES (?, 'generation', ?, ?, ?, ?)",
+                        [(db,) + tuple(r) for r in generation_rows])
+        cat.execute("INSERT OR REPLACE INTO runs (db, size, mtime_ns, generations, config) VALUES (?, ?, ?, ?, ?)",
+                    (db, size, mtime_ns, int(generations), json.dumps(cfg)))
+
+def update_catalog(cat, db_paths, top_k=TOP_K, prune=False):
+    """Index the databases that are new or changed since they were last indexed, returns the indexed paths.
+    With prune, the runs whose database is not in db_paths are removed from the catalog."""
+    known = {db: (size, mtime_ns) for db, size, mtime_ns in cat.execute("SELECT db, size, mtime_ns FROM runs")}
+    indexed = []
+    for db_path in db_paths:
+        if known.get(os.path.abspath(db_path)) == file_key(db_path):
+            continue
+        try:
+            index_run(cat, db_path, top_k)
+        except sqlite3.Error as e:  # Not a training database (yet), it is tried again on the next update
+            print(f"Skipping {db_path}: {e}")
+            continue
+        indexed.append(db_path)
+    if prune:
+        current = {os.path.abspath(p) for p in db_paths}
+        with cat:
+            for db in set(known) - current:
+                cat.execute("DELETE FROM runs WHERE db = ?", (db,))
+                cat.execute("DELETE FROM elites WHERE db = ?", (db,))
+    return indexed
+
+def top_individuals(cat, limit=1, db=None, generation=None):
+    """The best individuals as (db, generation, individual, fitness, result_rowid, config) tuples.
+    Across all the runs by default, within a run with db and within one of its generations with generation."""
+    if generation is not None and db is None:
+        raise ValueError("generation requires db")
+    scope = "run" if generation is None else "generation"
+    query = "SELECT e.db, e.generation, e.individual, e.fitness, e.result_rowid, r.config FROM elites e JOIN runs r ON r.db = e.db WHERE e.scope = ?"
+    params = [scope]
+    if db is not None:
+        query += " AND e.db = ?"
+        params.append(os.path.abspath(db))
+    if generation is not None:
+        query += " AND e.generation = ?"
+        params.append(int(generation))
+    query += " ORDER BY e.fitness DESC, e.db, e.generation, e.individual LIMIT ?"
+    params.append(int(limit))
+    return [row[:5] + (json.loads(row[5]),) for row in cat.execute(query, params)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the catalog of the elite individuals and list the best ones.")
+    parser.add_argument("--db-folder", type=str, default="data", help="Folder containing SQLite DBs (default: ./data).")
+    parser.add_argument("--top", type=int, default=10, help="Number of individuals to list (default: 10).")
+    args = parser.parse_args()
+
+    cat = open_catalog(catalog_path(args.db_folder))
+    try:
+        indexed = update_catalog(cat, sorted(glob.glob(os.path.join(args.db_folder, "*.sqlite3"))), prune=True)
+        print(f"Indexed {len(indexed)} new or changed databases")
+        for db, generation, individual, fitness, _, _ in top_individuals(cat, args.top):
+            print(f"{fitness:.4f}\t{os.path.basename(db)}\tgeneration {generation}\tindividual {individual}")
+    finally:
+        cat.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Atomic checkpoints of the CMA-ES state so that a training run can be resumed."""
+
+import os
+import pickle
+import random
+import numpy as np
+
+CHECKPOINT_VERSION = 1
+
+def checkpoint_path(db_path):
+    """The sidecar checkpoint file of a run database"""
+    return os.path.splitext(db_path)[0] + ".ckpt"
+
+def make_checkpoint(es, generation, cfg):
+    """Serialize the full evolution strategy state after the given (completed) generation"""
+    payload = {
+        "version": CHECKPOINT_VERSION,
+        "generation": int(generation),
+        "es": es,  # Mean, covariance, step size, evolution paths and the internal counters of CMA-ES
+        "numpy_random_state": np.random.get_state(),  # CMA-ES samples from the global NumPy RNG
+        "random_state": random.getstate(),
+        "cfg": dict(cfg),
+    }
+    return pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+def save_checkpoint(path, data):
+    """Atomically replace the checkpoint file with the serialized data"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)  # Readers see either the old or the new checkpoint, never a partial one
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def load_checkpoint(path):
+    """Load a checkpoint and restore the global RNG states, returns the payload"""
+    with open(path, "rb") as f:
+        payload = pickle.load(f)
+    if payload.get("version") != CHECKPOINT_VERSION:
+        raise RuntimeError(f"Unsupported checkpoint version {payload.get('version')!r} in {path!r}")
+    np.random.set_state(payload["numpy_random_state"])
+    random.setstate(payload["random_state"])
+    return payload
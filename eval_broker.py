@@ -0,0 +1,260 @@
+"""Evaluation broker that farms the games of a generation out to worker machines over plain TCP.
+
+train_nn.py runs the coordinator (EvaluationBroker), which listens for workers and hands out
+(theta, n_games, seed) tasks. A worker is started on every machine with
+
+    python3 eval_broker.py --host <coordinator> --port 5555 --processes 16
+
+and plays its tasks in a local process pool. Workers can join or leave at any time, the tasks
+of a worker that disconnects are queued again. Messages are a JSON header followed by an optional
+raw float64 payload (the weights), no pickles are exchanged.
+"""
+
+import argparse
+import collections
+import hmac
+import ipaddress
+import json
+import multiprocessing
+import os
+import socket
+import struct
+import threading
+import time
+import concurrent.futures as futures
+import numpy as np
+
+HEADER = struct.Struct(">II")  # Length of the JSON header, length of the binary payload
+
+def is_loopback(host):
+    """True when host only accepts connections from this machine"""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+def send_message(sock, message, payload=b""):
+    header = json.dumps(message).encode()
+    sock.sendall(HEADER.pack(len(header), len(payload)) + header + payload)
+
+def recv_exact(sock, n):
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+def recv_message(sock):
+    """The next (message, payload) from the socket"""
+    header_len, payload_len = HEADER.unpack(recv_exact(sock, HEADER.size))
+    message = json.loads(recv_exact(sock, header_len))
+    return message, recv_exact(sock, payload_len) if payload_len else b""
+
+class WorkerConnection:
+    """A connected worker machine with the tasks it is playing"""
+    def __init__(self, sock, address, slots):
+        self.sock = sock
+        self.address = address
+        self.slots = int(slots)  # Number of tasks the worker plays at once
+        self.inflight = {}  # task id -> task
+        self.send_lock = threading.Lock()
+
+class EvaluationBroker:
+    """Coordinator that runs the tasks of a generation on the connected workers.
+
+    A task is (theta, n_games, seed) and its result is the number of games won. Every worker gets
+    as many tasks as it has processes. The tasks of a worker that leaves are queued again, so a
+    generation completes as long as at least one worker is connected.
+    """
+    def __init__(self, setup, host="127.0.0.1", port=5555, token=""):
+        # The wins sent back by the workers go straight into es.tell, so other machines must present a token
+        if not token and not is_loopback(host):
+            raise ValueError(f"A token is required to listen on {host}, set BROKER_TOKEN")
+        self.setup = dict(setup)  # Evaluation settings sent to every worker when it joins
+        self.token = str(token)
+        self.lock = threading.Condition()
+        self.workers = []
+        self.pending = collections.deque()  # task ids waiting for a worker
+        self.tasks = {}  # task id -> (theta, n_games, seed) of the current map() call
+        self.results = {}
+        self.next_id = 0
+        self.closed = False
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()
+        threading.Thread(target=self._accept, name="broker-accept", daemon=True).start()
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                sock, address = self.server.accept()
+            except OSError:  # The server socket was closed
+                return
+            threading.Thread(target=self._serve, args=(sock, address), name=f"broker-{address}", daemon=True).start()
+
+    def _serve(self, sock, address):
+        """Handshake with a worker, then read its results until it disconnects"""
+        worker = None
+        message = None
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)  # Detects the machines that vanish without closing
+            hello, _ = recv_message(sock)
+            if hello.get("type") != "hello" or not hmac.compare_digest(str(hello.get("token", "")), self.token):
+                send_message(sock, {"type": "rejected"})
+                sock.close()
+                print(f"Rejected worker {address}")
+                return
+            worker = WorkerConnection(sock, address, max(1, int(hello.get("slots", 1))))
+            send_message(sock, {"type": "setup", "setup": self.setup})
+            with self.lock:
+                self.workers.append(worker)
+                print(f"Worker {address} joined with {worker.slots} processes ({len(self.workers)} workers)")
+                self._dispatch()
+            while True:
+                message = None
+                message, _ = recv_message(sock)
+                if message.get("type") == "result":
+                    task_id, wins = int(message["id"]), int(message["wins"])  # Parsed first, a bad message keeps its task in flight
+                    with self.lock:
+                        if worker.inflight.pop(task_id, None) is not None and task_id in self.tasks:
+                            self.results[task_id] = wins
+                        self._dispatch()
+                        self.lock.notify_all()
+        except (ConnectionError, OSError):
+            pass
+        except (ValueError, KeyError, TypeError, AttributeError) as e:  # The worker is dropped and its tasks are queued again
+            print(f"Rejected message from worker {address}: {message!r} ({e!r})")
+        finally:
+            if worker is not None:
+                with self.lock:
+                    self.workers.remove(worker)
+                    # Queue the lost tasks again, in front of the ones that were never sent
+                    self.pending.extendleft(sorted(worker.inflight, reverse=True))
+                    print(f"Worker {address} left, {len(worker.inflight)} tasks queued again ({len(self.workers)} workers)")
+                    worker.inflight.clear()
+                    self._dispatch()
+                    self.lock.notify_all()
+            sock.close()
+
+    def _dispatch(self):
+        """Send pending tasks to the workers with free slots, called with the lock held"""
+        for worker in self.workers:
+            while self.pending and len(worker.inflight) < worker.slots:
+                task_id = self.pending.popleft()
+                if task_id in self.results:
+                    continue
+                theta, n_games, seed = self.tasks[task_id]
+                worker.inflight[task_id] = self.tasks[task_id]
+                try:
+                    with worker.send_lock:
+                        send_message(worker.sock, {"type": "task", "id": task_id, "n_games": int(n_games), "seed": seed},
+                                     np.ascontiguousarray(theta, dtype=np.float64).tobytes())
+                except OSError:  # The reader thread of the worker requeues its tasks
+                    break
+
+    def slots(self):
+        """Number of tasks the connected workers play at once"""
+        with self.lock:
+            return sum(worker.slots for worker in self.workers)
+
+    def map(self, tasks):
+        """Play the (theta, n_games, seed) tasks on the workers and return the wins of each task, in order"""
+        with self.lock:
+            ids = []
+            for task in tasks:
+                self.tasks[self.next_id] = task
+                self.pending.append(self.next_id)
+                ids.append(self.next_id)
+                self.next_id += 1
+            self._dispatch()
+            waiting_since = time.monotonic()
+            while not all(i in self.results for i in ids):
+                if not self.workers and time.monotonic() - waiting_since > 10.0:
+                    print(f"Waiting for evaluation workers on port {self.address[1]}...")
+                    waiting_since = time.monotonic()
+                self.lock.wait(timeout=1.0)
+            wins = [self.results.pop(i) for i in ids]
+            for i in ids:
+                del self.tasks[i]
+            return wins
+
+    def close(self):
+        self.closed = True
+        self.server.close()
+        with self.lock:
+            for worker in self.workers:
+                try:
+                    worker.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+def run_worker(host, port, processes, token=""):
+    """Connect to the coordinator and play its tasks until it closes the connection"""
+    import train_nn  # The training dependencies are only needed by the machines that play games
+
+    sock = socket.create_connection((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    send_message(sock, {"type": "hello", "token": token, "slots": processes})
+    message, _ = recv_message(sock)
+    if message.get("type") != "setup":
+        raise SystemExit(f"The coordinator rejected this worker ({message.get('type')})")
+    setup = message["setup"]
+    print(f"Connected to {host}:{port} with {processes} processes")
+
+    send_lock = threading.Lock()
+    def send_result(future):
+        try:
+            task_id, wins = future.result()
+            with send_lock:
+                send_message(sock, {"type": "result", "id": task_id, "wins": wins})
+        except futures.CancelledError:
+            pass
+        except Exception as e:  # Drop the connection, the coordinator gives the tasks of this worker to the others
+            print(f"Task failed: {e!r}")
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    initargs = (setup["input_dim"], setup["output_dim"], setup["num_planets"], setup["opponent"],
+                setup["hidden_sizes"], setup["concurrent_games"], setup["backend"])
+    # Spawned, not forked: forked processes would keep the socket open after this process dies,
+    # and the coordinator would never notice that the worker left
+    context = multiprocessing.get_context("spawn")
+    with futures.ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=train_nn.init_theta_worker, initargs=initargs) as executor:
+        try:
+            while True:
+                message, payload = recv_message(sock)
+                if message.get("type") != "task":
+                    continue
+                theta = np.frombuffer(payload, dtype=np.float64)
+                task = (int(message["id"]), theta, int(message["n_games"]), message["seed"])
+                executor.submit(train_nn.play_theta_games, task).add_done_callback(send_result)
+        except (ConnectionError, OSError):
+            print("The coordinator closed the connection")
+        finally:
+            executor.shutdown(cancel_futures=True)
+            sock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluation worker that plays the games of a train_nn.py run with broker: true.")
+    parser.add_argument("--host", type=str, default="localhost", help="Host of the training coordinator (default: localhost)")
+    parser.add_argument("--port", type=int, default=5555, help="Port of the training coordinator (default: 5555)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Number of game-playing processes (default: number of cores)")
+    parser.add_argument("--token", type=str, default=os.environ.get("BROKER_TOKEN", ""), help="Shared token of the run (default: $BROKER_TOKEN)")
+    parser.add_argument("--retry", type=float, default=5.0, help="Seconds between reconnection attempts, 0 exits instead (default: 5)")
+    args = parser.parse_args()
+    while True:
+        try:
+            run_worker(args.host, args.port, args.processes, args.token)
+        except OSError as e:
+            print(f"Can not reach {args.host}:{args.port}: {e}")
+        if args.retry <= 0:
+            break
+        time.sleep(args.retry)
+
+if __name__ == "__main__":
+    main()
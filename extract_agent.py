@@ -3,7 +3,10 @@ import ast
 import glob
 import os
 import sqlite3
-import numpy as np
+import catalog
+from catalog import catalog_path, open_catalog, top_individuals, update_catalog
+from solution_codec import codec_from_config, decode_solution
+from weight_file import save_agent_file
 
 def load_config(cur):
     # Fetch all the config table
@@ -41,42 +44,57 @@ def pick_row(cur, generation, individual):
     if row is None: raise RuntimeError("No matching row found in results table")
     return row
 
+def agent_from_config(cfg, weights, db_path):
+    try:
+        # Scrape the crucial config components
+        num_planets = int(cfg["num_planets"])
+        num_features = int(cfg["num_features"])
+        hidden_sizes = list(ast.literal_eval(cfg["hidden_sizes"]))
+    except KeyError as e:
+        raise RuntimeError(f"Missing config key {e} in {db_path!r}")
+
+    return {
+        "num_planets": num_planets,
+        "num_features": num_features,
+        "hidden_sizes": list(hidden_sizes),
+        "solution": weights,
+    }
+
 def best_from_db(db_path, generation, individual):
     conn = sqlite3.connect(db_path)
     try:
         cur = conn.cursor()
         cfg = load_config(cur)  # Load the config of the database
 
-        try:
-            # Scrape the crucial config components
-            num_planets = int(cfg["num_planets"])
-            num_features = int(cfg["num_features"])
-            hidden_sizes = list(ast.literal_eval(cfg["hidden_sizes"]))
-        except KeyError as e:
-            raise RuntimeError(f"Missing config key {e} in {db_path!r}")
-
-        # Scrape the individual
-        _, _, fitness, solution = pick_row(cur, generation, individual)
-        weights = np.frombuffer(solution, dtype=np.float64)
-
-        agent_dict = {
-            "num_planets": num_planets,
-            "num_features": num_features,
-            "hidden_sizes": list(hidden_sizes),
-            "solution": weights,
-        }
-        return agent_dict, float(fitness)
+        # Scrape the individual and decode its solution with the storage codec of the run
+        gen, _, fitness, solution = pick_row(cur, generation, individual)
+        weights = decode_solution(conn, codec_from_config(cfg), gen, solution)
+        return agent_from_config(cfg, weights, db_path), float(fitness)
+    finally:
+        conn.close()
+
+def agent_from_catalog(entry):
+    """Load the individual of a catalog entry, reading only its own row of the run database"""
+    db_path, generation, _, fitness, rowid, cfg = entry
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT solution FROM results WHERE rowid = ?", (rowid,)).fetchone()
+        if row is None: raise RuntimeError(f"Catalog entry not found in {db_path!r}, run catalog.py to rebuild it")
+        weights = decode_solution(conn, codec_from_config(cfg), generation, row[0])
     finally:
         conn.close()
+    return agent_from_config(cfg, weights, db_path), float(fitness)
 
 def main():
     # Command Line arguments to control what to extract
-    parser = argparse.ArgumentParser(description="Extract an individual from training databases into a .npy file.")
+    parser = argparse.ArgumentParser(description="Extract an individual from training databases into a weight file.")
     parser.add_argument("--db", type=str, help="Path to a specific SQLite DB (default: search in db-folder).")
     parser.add_argument("--db-folder", type=str, default="data", help="Folder containing SQLite DBs (default: ./data).")
     parser.add_argument("--generation", type=int, help="Generation index to select within the DB.")
     parser.add_argument("--individual", type=int, help="Individual index to select within the generation.")
-    parser.add_argument("--outfile", type=str, default="sharp_agent_weights.npy", help="Output .npy file (default: sharp_agent_weights.npy).")
+    parser.add_argument("--top", type=int, default=0, help="Also list the N best individuals across the runs (default: 0).")
+    parser.add_argument("--outfile", type=str, default="sharp_agent_weights.pwnn", help="Output weight file, the legacy format when it ends with .npy (default: sharp_agent_weights.pwnn).")
+    parser.add_argument("--dtype", type=str, default="float32", help="Storage dtype of a .pwnn weight file: float32 or float64 (default: float32).")
     args = parser.parse_args()
 
     base_dir = os.path.dirname(os.path.abspath(__file__))  # Project directory
@@ -96,32 +114,54 @@ def main():
         if not os.path.exists(db_path): raise SystemExit(f"DB file not found: {db_path}")
 
         agent_dict, fitness = best_from_db(db_path, generation, individual)
-        np.save(os.path.join(base_dir, args.outfile), agent_dict)
+        save_agent_file(os.path.join(base_dir, args.outfile), agent_dict, args.dtype)
         print(f"Wrote individual from {db_path} (fitness={fitness:.2f}) to {args.outfile}")
         return
 
-    # If no database is specified, find the overall best
+    # If no database is specified, find the overall best in the catalog of the elite individuals
     db_paths = sorted(glob.glob(os.path.join(db_folder, "*.sqlite3")))
     if not db_paths: raise SystemExit(f"No .sqlite3 databases found in {db_folder!r}")
 
-    best_fitness = float("-inf")
-    best_agent = None
-    best_db = None
+    cat = open_catalog(catalog_path(db_folder))
+    try:
+        update_catalog(cat, db_paths, prune=True)  # Only the new or changed databases are indexed
+        entries = top_individuals(cat, max(args.top, catalog.TOP_K))
+    finally:
+        cat.close()
+
+    if args.top > 0:  # List the best individuals across the runs
+        for rank, (db_path, gen, ind, fitness, _, _) in enumerate(entries[:args.top], start=1):
+            print(f"{rank:3d}. fitness={fitness:.4f}  {os.path.basename(db_path)}  generation={gen}  individual={ind}")
 
-    for db_path in db_paths:
+    best_agent = None
+    skipped = set()
+    for entry in entries:  # The best individual whose run has a usable config
+        if entry[0] in skipped:
+            continue
         try:
-            agent_dict, fitness = best_from_db(db_path, None, None)
+            best_agent, best_fitness = agent_from_catalog(entry)
         except Exception as e:
-            print(f"Skipping {db_path}: {e}")
+            print(f"Skipping {entry[0]}: {e}")
+            skipped.add(entry[0])
             continue
-        if fitness > best_fitness:
-            best_fitness = fitness
-            best_agent = agent_dict
-            best_db = db_path
-
+        best_db = entry[0]
+        break
+
+    if best_agent is None:  # None of the catalog entries could be loaded, read every run database directly
+        best_fitness = float("-inf")
+        for db_path in db_paths:
+            try:
+                agent_dict, fitness = best_from_db(db_path, None, None)
+            except Exception as e:
+                print(f"Skipping {db_path}: {e}")
+                continue
+            if fitness > best_fitness:
+                best_fitness = fitness
+                best_agent = agent_dict
+                best_db = db_path
     if best_agent is None: raise SystemExit("No valid individuals found in any database.")
 
-    np.save(os.path.join(base_dir, args.outfile), agent_dict)
+    save_agent_file(os.path.join(base_dir, args.outfile), best_agent, args.dtype)
     print(f"Wrote best overall individual from {best_db} (fitness={best_fitness:.4f}) to {args.outfile}")
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+"""A pool of pre-generated maps shared by the evaluation workers (common random numbers across a generation)."""
+
+import random
+from multiprocessing import shared_memory
+import numpy as np
+
+from core.game_state import GameState, Planet, Player, Vec2d  # type: ignore
+from core.game_state_factory import GameStateFactory  # type: ignore
+
+OWNERS = [Player.Neutral, Player.Player1, Player.Player2]  # Owner codes of the encoded planets
+PLANET_FIELDS = 7  # owner code, n_ships, x, y, growth_rate, radius, id
+
+def map_seeds(base_seed, generation, pool_size):
+    """The seeds of the maps drawn for a generation, derived from the seed of the run"""
+    rng = np.random.default_rng([int(base_seed), int(generation)])
+    return rng.integers(0, 2**31 - 1, size=pool_size, dtype=np.int64)
+
+def encode_state(state):
+    """Initial game state -> (num_planets, PLANET_FIELDS) float64 array"""
+    rows = np.zeros((len(state.planets), PLANET_FIELDS), dtype=np.float64)
+    for i, p in enumerate(state.planets):
+        rows[i] = (OWNERS.index(p.owner), p.n_ships, p.position.x, p.position.y, p.growth_rate, p.radius, p.id)
+    return rows
+
+def decode_state(rows):
+    """(num_planets, PLANET_FIELDS) array -> a fresh initial game state"""
+    planets = [
+        Planet(owner=OWNERS[int(r[0])], n_ships=float(r[1]), position=Vec2d(x=float(r[2]), y=float(r[3])),
+               growth_rate=float(r[4]), radius=float(r[5]), id=int(r[6]))
+        for r in rows.tolist()
+    ]
+    return GameState(planets=planets, game_tick=0)
+
+def generate_maps(params, seeds):
+    """Generate the initial state of every seed, returns a (len(seeds), num_planets, PLANET_FIELDS) array"""
+    # The map generator draws from the global RNGs, keep the state of the rest of the program intact
+    py_state, np_state = random.getstate(), np.random.get_state()
+    try:
+        maps = []
+        for seed in seeds:
+            random.seed(int(seed))
+            np.random.seed(int(seed))
+            maps.append(encode_state(GameStateFactory(params).create_game()))
+    finally:
+        random.setstate(py_state)
+        np.random.set_state(np_state)
+    return np.stack(maps)
+
+class MapPool:
+    """A (pool_size, num_planets, PLANET_FIELDS) float64 array in shared memory that holds the maps of the current generation"""
+    def __init__(self, pool_size, num_planets):
+        self.shape = (pool_size, num_planets, PLANET_FIELDS)
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)) * np.dtype(np.float64).itemsize)
+        self.maps = np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def publish(self, maps):
+        """Copy the generated maps into the shared array"""
+        if maps.shape != self.shape:
+            raise ValueError(f"Expected maps of shape {self.shape}, got {maps.shape}")
+        self.maps[...] = maps
+
+    def close(self):
+        del self.maps  # Release the buffer before closing the shared memory
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,159 @@
+"""Torch-free NumPy inference for the NeuralNetwork used by the Planet Wars agents."""
+
+import math
+import numpy as np
+
+def sigmoid(v):
+    """Overflow-free logistic function of a float"""
+    if v >= 0:
+        return 1.0 / (1.0 + math.exp(-v))
+    z = math.exp(v)
+    return z / (1.0 + z)
+
+class NumpyNetwork:
+    """Inference-only NumPy version of torch_network.NeuralNetwork.
+
+    The flat weight vector uses the same layout as NeuralNetwork.set_model_weights
+    (weight then bias of each nn.Linear layer). The outputs match the torch path within
+    rtol = atol = 1e-5 in both float32 and float64.
+    The returned planet logits are views into buffers that are overwritten on the next call.
+    """
+    def __init__(self, input_dim, output_dim, hidden_sizes, dtype=np.float32):
+        """Allocate the layer matrices for the given input, hidden and output sizes"""
+        self.sizes = [int(input_dim)] + [int(h) for h in hidden_sizes] + [int(output_dim)]
+        self.dtype = np.dtype(dtype)
+        # The weights are stored transposed as (in, out) so that a layer is out = x @ W + b
+        self.weights = [np.zeros((n_in, n_out), dtype=self.dtype) for n_in, n_out in zip(self.sizes[:-1], self.sizes[1:])]
+        self.biases = [np.zeros((n_out,), dtype=self.dtype) for n_out in self.sizes[1:]]
+        self.num_params = sum(W.size + b.size for W, b in zip(self.weights, self.biases))
+        self.x = np.zeros((1, self.sizes[0]), dtype=self.dtype)  # Input buffer for the single forward pass
+        self.buffers = {}  # The activation buffers of each batch size
+
+    def eval(self):
+        """No-op, kept so that the network can be used in place of the torch model"""
+        return self
+
+    def set_model_weights(self, flat_weights):
+        """Compile the layer matrices from a flat numpy array"""
+        flat_weights = np.asarray(flat_weights)
+        if flat_weights.size != self.num_params:
+            raise ValueError(f"Expected {self.num_params} weights, got {flat_weights.size}")
+        prev_ind = 0
+        for W, b in zip(self.weights, self.biases):
+            n_in, n_out = W.shape
+            W[...] = flat_weights[prev_ind:prev_ind + n_in * n_out].reshape(n_out, n_in).T  # torch stores (out, in)
+            prev_ind += n_in * n_out
+            b[...] = flat_weights[prev_ind:prev_ind + n_out]
+            prev_ind += n_out
+
+    def set_layers(self, weights, biases):
+        """Use the (in, out) weight matrices and the biases as they are, without copying them
+        (e.g. the read-only views of a memory-mapped weight file, see weight_file.py)"""
+        for W, b, n_in, n_out in zip(weights, biases, self.sizes[:-1], self.sizes[1:]):
+            if W.shape != (n_in, n_out) or b.shape != (n_out,) or W.dtype != self.dtype or b.dtype != self.dtype:
+                raise ValueError(f"Expected a ({n_in}, {n_out}) layer of {self.dtype}, got {W.shape} of {W.dtype}")
+        if len(weights) != len(self.weights) or len(biases) != len(self.biases):
+            raise ValueError(f"Expected {len(self.weights)} layers, got {len(weights)}")
+        self.weights = list(weights)
+        self.biases = list(biases)
+
+    def get_model_weights(self):
+        """Returns a flat numpy array of all model weights and biases"""
+        weights = []
+        for W, b in zip(self.weights, self.biases):
+            weights.append(W.T.reshape(-1))
+            weights.append(b)
+        return np.concatenate(weights, axis=0)
+
+    def _activations(self, batch_size):
+        """The preallocated output buffers of every layer for the batch size"""
+        buffers = self.buffers.get(batch_size)
+        if buffers is None:
+            buffers = [np.zeros((batch_size, n_out), dtype=self.dtype) for n_out in self.sizes[1:]]
+            self.buffers[batch_size] = buffers
+        return buffers
+
+    def _forward(self, x):
+        """Forward pass for a (K, input_dim) array, returns the (K, output_dim) output buffer"""
+        buffers = self._activations(x.shape[0])
+        last = len(self.weights) - 1
+        for i, (W, b, out) in enumerate(zip(self.weights, self.biases, buffers)):
+            np.matmul(x, W, out=out)
+            out += b
+            if i < last:
+                np.maximum(out, 0, out=out)  # ReLU
+            x = out
+        return x
+
+    def forward_outputs(self, flat_vec):
+        """Forward pass through the neural network"""
+        self.x[0] = flat_vec
+        y = self._forward(self.x)[0]
+        noop_logits = float(y[0])
+        planet_logits = y[1:-1]
+        ship_ratio = sigmoid(float(y[-1]))
+        return noop_logits, planet_logits, ship_ratio
+
+    def forward_batch(self, batch):
+        """Forward pass for a (K, input_dim) batch, returns the noop logits, planet logits and ratios of each row"""
+        y = self._forward(np.asarray(batch, dtype=self.dtype))
+        noop_logits = y[:, 0]
+        planet_logits = y[:, 1:-1]
+        z = np.exp(-np.abs(y[:, -1]))  # Overflow-free sigmoid
+        ship_ratios = np.where(y[:, -1] >= 0, 1.0 / (1.0 + z), z / (1.0 + z))
+        return noop_logits, planet_logits, ship_ratios
+
+class PopulationNetwork:
+    """Inference for a whole population of networks that share the same architecture.
+
+    The layers of the P candidates are stacked into (P, in, out) tensors so that one batched
+    matmul per layer evaluates a (P, K, input_dim) batch of K game states for every candidate.
+    The weights of each candidate use the layout of NeuralNetwork.set_model_weights.
+    """
+    def __init__(self, input_dim, output_dim, hidden_sizes, popsize, dtype=np.float32):
+        """Allocate the stacked layer tensors for popsize candidates"""
+        self.sizes = [int(input_dim)] + [int(h) for h in hidden_sizes] + [int(output_dim)]
+        self.popsize = int(popsize)
+        self.dtype = np.dtype(dtype)
+        self.weights = [np.zeros((self.popsize, n_in, n_out), dtype=self.dtype) for n_in, n_out in zip(self.sizes[:-1], self.sizes[1:])]
+        self.biases = [np.zeros((self.popsize, 1, n_out), dtype=self.dtype) for n_out in self.sizes[1:]]
+        self.num_params = sum((W.size + b.size) // self.popsize for W, b in zip(self.weights, self.biases))
+        self.buffers = {}  # The activation buffers of each number of games per candidate
+
+    def eval(self):
+        """No-op, kept so that the network can be used in place of the torch model"""
+        return self
+
+    def set_population_weights(self, flat_weights):
+        """Compile the stacked layer tensors from a (popsize, num_params) matrix of flat weights"""
+        flat_weights = np.asarray(flat_weights)
+        if flat_weights.shape != (self.popsize, self.num_params):
+            raise ValueError(f"Expected weights of shape {(self.popsize, self.num_params)}, got {flat_weights.shape}")
+        prev_ind = 0
+        for W, b in zip(self.weights, self.biases):
+            _, n_in, n_out = W.shape
+            W[...] = flat_weights[:, prev_ind:prev_ind + n_in * n_out].reshape(self.popsize, n_out, n_in).transpose(0, 2, 1)
+            prev_ind += n_in * n_out
+            b[:, 0, :] = flat_weights[:, prev_ind:prev_ind + n_out]
+            prev_ind += n_out
+
+    def forward_batch(self, batch):
+        """Forward pass for a (popsize, K, input_dim) batch, returns the (popsize, K) noop logits,
+        (popsize, K, num_planets) planet logits and (popsize, K) ship ratios"""
+        x = np.asarray(batch, dtype=self.dtype)
+        buffers = self.buffers.get(x.shape[1])
+        if buffers is None:
+            buffers = [np.zeros((self.popsize, x.shape[1], n_out), dtype=self.dtype) for n_out in self.sizes[1:]]
+            self.buffers[x.shape[1]] = buffers
+        last = len(self.weights) - 1
+        for i, (W, b, out) in enumerate(zip(self.weights, self.biases, buffers)):
+            np.matmul(x, W, out=out)  # (P, K, in) @ (P, in, out), one batched matmul for the whole population
+            out += b
+            if i < last:
+                np.maximum(out, 0, out=out)  # ReLU
+            x = out
+        noop_logits = x[:, :, 0]
+        planet_logits = x[:, :, 1:-1]
+        z = np.exp(-np.abs(x[:, :, -1]))  # Overflow-free sigmoid
+        ship_ratios = np.where(x[:, :, -1] >= 0, 1.0 / (1.0 + z), z / (1.0 + z))
+        return noop_logits, planet_logits, ship_ratios
@@ -6,49 +6,37 @@ import matplotlib.pyplot as plt
 import numpy as np
 import scienceplots
 
+from results_db import connect_readonly, ensure_generation_stats, generation_stats_complete, read_config, read_generation_stats
+
 MAX_GENERATIONS = 500
 
 plt.style.use(['science', 'no-latex'])
 
-def read_generation_stats(db_path):
-    connection = sqlite3.connect(db_path)  # Connect to the db
+def read_run(db_path):
+    """Read the config and the per-generation summary of a run with a single connection"""
+    connection = connect_readonly(db_path)  # Plotting leaves the run database as it is
     try:
-        cursor = connection.cursor()
-        cursor.execute(
-            """
-            SELECT generation,
-                   AVG(fitness) AS avg_fitness,
-                   MAX(fitness) AS best_fitness
-            FROM results
-            GROUP BY generation
-            ORDER BY generation
-            """
-        )
-        # Get the generational data for each generation in the run
-        rows = cursor.fetchall()[:MAX_GENERATIONS]
-        generations = [int(r[0]) for r in rows]
-        avg_fitness = [float(r[1]) for r in rows]
-        best_fitness = [float(r[2]) for r in rows]
-        return generations, avg_fitness, best_fitness
+        if not generation_stats_complete(connection):  # One-time backfill for databases of older runs
+            connection.close()
+            connection = sqlite3.connect(db_path)  # Writes without switching the database to WAL mode
+            with connection:
+                ensure_generation_stats(connection)
+        cfg = read_config(connection)
+        # Get the generational data for each generation in the run, one small row per generation
+        rows = read_generation_stats(connection)[:MAX_GENERATIONS]
+        generations = [int(r["generation"]) for r in rows]
+        avg_fitness = [float(r["mean"]) for r in rows]
+        best_fitness = [float(r["best"]) for r in rows]
+        return cfg, generations, avg_fitness, best_fitness
     finally:
         connection.close()  # At the end close the database connection
 
-def read_run_config(db_path, key, default=""):
-    connection = sqlite3.connect(db_path)
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT v FROM config WHERE k = ?", (key,))
-        row = cursor.fetchone()
-        return row[0] if row and row[0] is not None else default
-    finally:
-        connection.close()
-
 def plot_run(db_path, output_dir):
     run_id = Path(db_path).stem
-    layers = read_run_config(db_path, "hidden_sizes", "[]")
-    games_per_individual = read_run_config(db_path, "games_per_eval", "")
+    cfg, generations, avg_fitness, best_fitness = read_run(db_path)
+    layers = cfg.get("hidden_sizes", "[]")
+    games_per_individual = cfg.get("games_per_eval", "")
 
-    generations, avg_fitness, best_fitness = read_generation_stats(db_path)
     if not generations:
         return [], []
 
@@ -0,0 +1,116 @@
+"""Per-phase timers and task spans for profiling training and match runs (--profile).
+
+Nothing is timed until instrument() replaces a function or method with a timed version, so the
+hot paths have no overhead when profiling is off. Every process collects into its own PROFILE:
+the pool workers send theirs back with every task (take), and the main process merges them (merge).
+Phases may nest, e.g. the state copies made inside an opponent's get_action are also counted in
+the opponent phase.
+
+The trace files use the Chrome trace event format and open in https://ui.perfetto.dev or
+chrome://tracing, with one row per worker process showing when it was busy.
+"""
+
+import collections
+import functools
+import json
+import os
+import time
+
+class Profile:
+    """Phase timers (total seconds and number of calls) and task spans of one process"""
+    def __init__(self):
+        self.seconds = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.spans = []  # (pid, label, start, end) with wall-clock times, comparable across processes
+
+    def add(self, phase, seconds, calls=1):
+        self.seconds[phase] += seconds
+        self.calls[phase] += calls
+
+    def add_span(self, label, start, end, pid=None):
+        self.spans.append((os.getpid() if pid is None else pid, label, start, end))
+
+    def take(self):
+        """The collected timers and spans as a plain dict (it is sent between processes), and start over"""
+        data = {"seconds": dict(self.seconds), "calls": dict(self.calls), "spans": list(self.spans)}
+        self.__init__()
+        return data
+
+    def merge(self, data):
+        """Add the timers and spans returned by take() in another process"""
+        for phase, seconds in data["seconds"].items():
+            self.add(phase, seconds, data["calls"].get(phase, 0))
+        self.spans.extend(tuple(span) for span in data["spans"])
+
+PROFILE = Profile()  # The profile of this process
+
+def timed(phase, fn):
+    """fn, adding the time of every call to the phase"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            PROFILE.add(phase, time.perf_counter() - start)
+    wrapper.__profiled__ = True
+    return wrapper
+
+def instrument(owner, name, phase):
+    """Replace the function or method owner.name (a module, class or object) with a timed version, once"""
+    fn = getattr(owner, name, None)
+    if fn is None or getattr(fn, "__profiled__", False):
+        return
+    setattr(owner, name, timed(phase, fn))
+
+def worker_stats(spans, wall_time):
+    """{pid: (tasks, busy seconds, utilization)} of the task spans, the utilization is relative to wall_time"""
+    busy = collections.defaultdict(float)
+    tasks = collections.Counter()
+    for pid, _, start, end in spans:
+        busy[pid] += end - start
+        tasks[pid] += 1
+    return {pid: (tasks[pid], busy[pid], busy[pid] / wall_time if wall_time > 0 else 0.0) for pid in busy}
+
+def format_phases(data, total=None):
+    """One line with the seconds of every phase, with its share of total when given"""
+    parts = []
+    for phase, seconds in sorted(data["seconds"].items(), key=lambda item: -item[1]):
+        share = f" ({seconds / total * 100:.0f}%)" if total else ""
+        parts.append(f"{phase}={seconds:.2f}s{share}")
+    return "  ".join(parts)
+
+class TraceWriter:
+    """Streams spans to a Chrome trace event file.
+
+    The events are written as they come, the closing bracket is optional in this format, so
+    the trace of an interrupted run still opens.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w")
+        self.file.write("[\n")
+        self.origin = time.time()  # Trace timestamps are microseconds since the trace was opened
+        self.threads = set()
+
+    def _event(self, event):
+        self.file.write(json.dumps(event) + ",\n")
+
+    def write_spans(self, spans, args=None):
+        for pid, label, start, end in spans:
+            if pid not in self.threads:  # Name the row of every process once
+                self.threads.add(pid)
+                name = "main" if pid == os.getpid() else f"worker {pid}"
+                self._event({"name": "thread_name", "ph": "M", "pid": 0, "tid": pid, "args": {"name": name}})
+            self._event({"name": label, "ph": "X", "pid": 0, "tid": pid, "ts": (start - self.origin) * 1e6,
+                         "dur": (end - start) * 1e6, "args": args or {}})
+
+    def write_counters(self, name, values, at=None):
+        """A counter track, e.g. the seconds of every phase of a generation"""
+        ts = ((time.time() if at is None else at) - self.origin) * 1e6
+        self._event({"name": name, "ph": "C", "pid": 0, "ts": ts, "args": values})
+        self.file.flush()
+
+    def close(self):
+        self.file.write(json.dumps({"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "profile"}}) + "\n]\n")
+        self.file.close()
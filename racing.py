@@ -0,0 +1,63 @@
+"""Racing evaluation that stops playing games once an individual's rank is settled."""
+
+from statistics import NormalDist
+import numpy as np
+
+def wilson_bounds(wins, games, z):
+    """Wilson score interval of the win ratios, individuals without games get [0, 1]"""
+    wins = np.asarray(wins, dtype=np.float64)
+    n = np.maximum(np.asarray(games, dtype=np.float64), 1.0)
+    p = wins / n
+    denom = 1.0 + z * z / n
+    center = (p + z * z / (2.0 * n)) / denom
+    half = z * np.sqrt(p * (1.0 - p) / n + z * z / (4.0 * n * n)) / denom
+    lower = np.where(np.asarray(games) > 0, np.clip(center - half, 0.0, 1.0), 0.0)
+    upper = np.where(np.asarray(games) > 0, np.clip(center + half, 0.0, 1.0), 1.0)
+    return lower, upper
+
+class Race:
+    """Plays the games of a population in rounds and retires individuals whose selection is settled.
+
+    es.tell only uses the ranking of the population, and what matters most is which individuals
+    make it into the mu selected parents. An individual stops playing once its confidence interval
+    shows that it is surely inside or surely outside of the best mu, once the interval is narrower
+    than tolerance (e.g. a candidate that loses every game), or when it reaches max_games.
+    """
+    def __init__(self, popsize, mu, confidence=0.95, min_games=10, max_games=100, tolerance=0.1):
+        self.mu = int(mu)
+        self.tolerance = float(tolerance)
+        self.min_games = int(min_games)
+        self.max_games = int(max_games)
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2.0)  # Two-sided z value of the confidence level
+        self.wins = np.zeros((popsize,), dtype=np.int64)
+        self.games = np.zeros((popsize,), dtype=np.int64)
+        self.done = np.zeros((popsize,), dtype=bool)
+
+    def next_round(self, round_games):
+        """The (individual, n_games) tasks of the next round, empty when the race is over"""
+        tasks = []
+        for idx in np.flatnonzero(~self.done):
+            target = self.min_games if self.games[idx] == 0 else self.games[idx] + round_games
+            n_games = int(min(target, self.max_games) - self.games[idx])
+            if n_games > 0:
+                tasks.append((int(idx), n_games))
+        return tasks
+
+    def record(self, idx, wins, n_games):
+        """Add the result of n_games played by the individual"""
+        self.wins[idx] += int(wins)
+        self.games[idx] += int(n_games)
+
+    def update(self):
+        """Retire the individuals whose place relative to the best mu can no longer change"""
+        lower, upper = wilson_bounds(self.wins, self.games, self.z)
+        # Number of other individuals that could still beat / that surely beat each individual
+        could_beat = (upper[None, :] >= lower[:, None]).sum(axis=1) - 1
+        surely_beat = (lower[None, :] > upper[:, None]).sum(axis=1)
+        settled = (could_beat < self.mu) | (surely_beat >= self.mu) | (upper - lower <= self.tolerance)
+        self.done |= (self.games >= self.max_games) | ((self.games >= self.min_games) & settled)
+        return bool(self.done.all())
+
+    def fitness(self):
+        """Win ratio of every individual over the games it played"""
+        return self.wins / np.maximum(self.games, 1)
@@ -0,0 +1,294 @@
+"""SQLite storage of the training runs: schema, in-place upgrades and a background results writer."""
+
+import argparse
+import glob
+import os
+import queue
+import sqlite3
+import threading
+import time
+from itertools import groupby
+import numpy as np
+from solution_codec import CODEC_VERSION, SolutionCodec, codec_from_config, decode_solution
+
+# One small row per generation, so readers never aggregate over the results (and their solution BLOBs)
+GENERATION_STATS_TABLE = (
+    "CREATE TABLE IF NOT EXISTS generation_stats (generation INTEGER PRIMARY KEY, individuals INTEGER, best REAL, mean REAL, median REAL, "
+    "p10 REAL, p25 REAL, p75 REAL, p90 REAL, worst REAL, games INTEGER, eval_time REAL, finished REAL)"
+)
+GENERATION_STATS_COLUMNS = ["generation", "individuals", "best", "mean", "median", "p10", "p25", "p75", "p90", "worst", "games", "eval_time", "finished"]
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS config (k TEXT PRIMARY KEY, v TEXT)",
+    # version is the CMA-ES iteration the solution was sampled at, older than the generation with async_evolution.
+    # fidelity tells how a screened fitness was measured (screening.py), NULL without screening.
+    "CREATE TABLE IF NOT EXISTS results (generation INTEGER, individual INTEGER, fitness REAL, solution BLOB, games INTEGER, version INTEGER, fidelity INTEGER)",
+    "CREATE TABLE IF NOT EXISTS maps (generation INTEGER, map INTEGER, seed INTEGER)",  # Seeds of the map pool, from the generation they were drawn
+    GENERATION_STATS_TABLE,
+    "CREATE TABLE IF NOT EXISTS solution_means (generation INTEGER PRIMARY KEY, mean BLOB)",  # float64 means of the delta32 codec
+    # Phase timers and worker utilization of every generation, only written by runs with --profile
+    "CREATE TABLE IF NOT EXISTS profile (generation INTEGER, phase TEXT, seconds REAL, calls INTEGER)",
+    "CREATE TABLE IF NOT EXISTS profile_workers (generation INTEGER, worker INTEGER, tasks INTEGER, busy REAL, utilization REAL)",
+]
+
+# Indexes for the best-of-generation / best-overall lookups and the per-generation aggregates.
+# (generation, fitness) covers GROUP BY generation with AVG/MAX(fitness) without touching the solution BLOBs.
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS results_generation_fitness ON results (generation, fitness)",
+    "CREATE INDEX IF NOT EXISTS results_fitness ON results (fitness)",
+]
+
+def connect(db_path):
+    """Open a training database in WAL mode"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")  # One fsync per generation, so the results are durable before a checkpoint
+    return conn
+
+def connect_readonly(db_path):
+    """Open a training database for reading only, without changing its journal mode or leaving -wal/-shm files behind"""
+    db = os.path.abspath(db_path)
+    if os.path.exists(db + "-wal"):  # A run in progress, its WAL files exist already
+        return sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+    return sqlite3.connect(f"file:{db}?immutable=1", uri=True)
+
+def ensure_schema(conn):
+    """Create the tables and indexes, and add the columns missing from databases of older runs"""
+    cur = conn.cursor()
+    for statement in SCHEMA:
+        cur.execute(statement)
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(results)")}
+    if "games" not in columns:
+        cur.execute("ALTER TABLE results ADD COLUMN games INTEGER")
+    if "version" not in columns:
+        cur.execute("ALTER TABLE results ADD COLUMN version INTEGER")
+    if "fidelity" not in columns:
+        cur.execute("ALTER TABLE results ADD COLUMN fidelity INTEGER")
+    for statement in INDEXES:
+        cur.execute(statement)
+    conn.commit()
+
+def generation_stats_row(generation, fitnesses, games, eval_time=None, finished=None):
+    """The generation_stats row of a generation, games is None when it is unknown (runs older than the games column)"""
+    f = np.asarray(fitnesses, dtype=np.float64)
+    p10, p25, median, p75, p90 = (float(x) for x in np.percentile(f, [10, 25, 50, 75, 90]))
+    return (int(generation), int(f.size), float(f.max()), float(f.mean()), median, p10, p25, p75, p90, float(f.min()),
+            None if games is None else int(games), eval_time, finished)
+
+def insert_generation_stats(conn, rows):
+    placeholders = ", ".join("?" for _ in GENERATION_STATS_COLUMNS)
+    conn.executemany(f"INSERT OR REPLACE INTO generation_stats ({', '.join(GENERATION_STATS_COLUMNS)}) VALUES ({placeholders})", rows)
+
+def backfill_generation_stats(conn):
+    """Fill generation_stats for the generations of older runs that only have results rows, returns the number of rows added"""
+    cur = conn.execute(
+        "SELECT generation, fitness, games FROM results "
+        "WHERE generation NOT IN (SELECT generation FROM generation_stats) ORDER BY generation"
+    )
+    rows = []
+    for generation, group in groupby(cur, key=lambda r: r[0]):
+        group = list(group)
+        games = [r[2] for r in group]
+        rows.append(generation_stats_row(generation, [r[1] for r in group], None if None in games else sum(games)))
+    with conn:
+        insert_generation_stats(conn, rows)
+    return len(rows)
+
+def ensure_generation_stats(conn):
+    """Backfill generation_stats once when it is missing generations of the results table.
+    The check only reads the (generation, fitness) index, so it is cheap for databases that are complete."""
+    conn.execute(GENERATION_STATS_TABLE)
+    if not generation_stats_complete(conn):
+        backfill_generation_stats(conn)
+
+def generation_stats_complete(conn):
+    """True when generation_stats has a row for every generation of the results table, works on read-only connections"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'generation_stats'").fetchone() is None:
+        return False
+    (n_stats,) = conn.execute("SELECT COUNT(*) FROM generation_stats").fetchone()
+    (last,) = conn.execute("SELECT MAX(generation) FROM results").fetchone()
+    return last is None or n_stats >= last + 1  # Generations are numbered from 0 without gaps
+
+def read_generation_stats(conn):
+    """The generation_stats rows of a run as dicts, ordered by generation"""
+    cur = conn.execute(f"SELECT {', '.join(GENERATION_STATS_COLUMNS)} FROM generation_stats ORDER BY generation")
+    return [dict(zip(GENERATION_STATS_COLUMNS, row)) for row in cur]
+
+def read_config(conn):
+    """The config of a run as a dict of strings"""
+    return {str(k): str(v) for k, v in conn.execute("SELECT k, v FROM config")}
+
+def migrate_solutions(conn, spec):
+    """Rewrite the solutions of a run database with another codec in one transaction"""
+    new = SolutionCodec(spec)
+    old = codec_from_config(read_config(conn))
+    generations = [g for (g,) in conn.execute("SELECT DISTINCT generation FROM results ORDER BY generation")]
+    with conn:  # An interrupted migration leaves the database untouched
+        for generation in generations:
+            rows = conn.execute("SELECT rowid, solution FROM results WHERE generation = ?", (generation,)).fetchall()
+            solutions = [decode_solution(conn, old, generation, blob) for _, blob in rows]
+            mean = new.generation_mean(solutions)
+            conn.execute("DELETE FROM solution_means WHERE generation = ?", (generation,))
+            if mean is not None:
+                conn.execute("INSERT INTO solution_means (generation, mean) VALUES (?, ?)", (generation, sqlite3.Binary(mean.tobytes())))
+            conn.executemany("UPDATE results SET solution = ? WHERE rowid = ?",
+                             [(sqlite3.Binary(new.encode(sol, mean)), rowid) for (rowid, _), sol in zip(rows, solutions)])
+        conn.executemany("INSERT OR REPLACE INTO config (k, v) VALUES (?, ?)",
+                         [("solution_codec", new.spec), ("solution_codec_version", str(CODEC_VERSION))])
+    conn.execute("VACUUM")  # Give the freed pages back to the file system
+
+def db_bytes(conn):
+    (page_count,) = conn.execute("PRAGMA page_count").fetchone()
+    (page_size,) = conn.execute("PRAGMA page_size").fetchone()
+    return page_count * page_size
+
+def upgrade_db(db_path):
+    """Upgrade an existing training database in place (WAL mode, new tables, columns and indexes)"""
+    conn = connect(db_path)
+    try:
+        ensure_schema(conn)
+        return backfill_generation_stats(conn)
+    finally:
+        conn.close()
+
+class ResultsWriter:
+    """Writes the results of a training run from a background thread.
+
+    Every generation is written with one executemany in a single transaction, so the disk I/O of a
+    generation overlaps with the evaluation of the next one. The queue is bounded, so the training
+    loop waits only if the writer falls more than max_pending generations behind.
+    """
+    def __init__(self, db_path, cfg=None, max_pending=4, codec=None, profile=False):
+        self.db_path = db_path
+        self.codec = codec if codec is not None else SolutionCodec()  # Storage codec of the solution BLOBs
+        self.profile = profile  # Record the time of every generation write as its db_write phase
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self.error = None  # The exception raised by the writer thread, re-raised in the training loop
+        self.thread = threading.Thread(target=self._run, name="results-writer", daemon=True)
+        self.thread.start()
+        if cfg is not None:
+            self.write_config(cfg)
+
+    def _run(self):
+        """Writer thread, owns the SQLite connection"""
+        conn = None
+        try:
+            conn = connect(self.db_path)
+            ensure_schema(conn)
+        except Exception as e:  # e.g. a locked or read-only database, raised by the next _submit or close
+            self.error = e
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:  # Sentinel of close()
+                    break
+                if self.error is None:  # After an error the jobs are dropped, so that the queue never fills up
+                    try:
+                        job(conn)
+                    except Exception as e:
+                        self.error = e
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _submit(self, job):
+        if self.error is not None:
+            raise RuntimeError(f"Results writer failed: {self.error!r}") from self.error
+        self.jobs.put(job)
+
+    def write_config(self, cfg):
+        """Save the run config as key/value pairs"""
+        rows = [(str(k), str(v)) for k, v in cfg.items()]
+        def job(conn):
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO config (k, v) VALUES (?, ?)", rows)
+        self._submit(job)
+
+    def write_generation(self, generation, solutions, fitnesses, games, eval_time=None, versions=None, fidelities=None):
+        """Save the individuals of a generation and its summary row in one transaction"""
+        solutions = [np.asarray(sol, dtype=np.float64) for sol in solutions]
+        fitnesses = [float(f) for f in fitnesses]
+        games = [int(g) for g in games]
+        versions = [None] * len(solutions) if versions is None else [int(v) for v in versions]
+        fidelities = [None] * len(solutions) if fidelities is None else [int(f) for f in fidelities]
+        stats = generation_stats_row(generation, fitnesses, sum(games), eval_time, time.time())
+        codec = self.codec
+        def job(conn):
+            start = time.perf_counter()
+            mean = codec.generation_mean(solutions)  # Encoded in the writer thread, off the training loop
+            rows = [(int(generation), idx, fitnesses[idx], sqlite3.Binary(codec.encode(sol, mean)), games[idx], versions[idx], fidelities[idx])
+                    for idx, sol in enumerate(solutions)]
+            with conn:
+                if mean is not None:
+                    conn.execute("INSERT OR REPLACE INTO solution_means (generation, mean) VALUES (?, ?)", (int(generation), sqlite3.Binary(mean.tobytes())))
+                conn.executemany("INSERT INTO results (generation, individual, fitness, solution, games, version, fidelity) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                insert_generation_stats(conn, [stats])
+            if self.profile:
+                with conn:
+                    conn.execute("INSERT INTO profile (generation, phase, seconds, calls) VALUES (?, 'db_write', ?, 1)",
+                                 (int(generation), time.perf_counter() - start))
+        self._submit(job)
+
+    def write_profile(self, generation, phases, workers):
+        """Save the phase timers {phase: (seconds, calls)} and worker stats {worker: (tasks, busy, utilization)} of a generation"""
+        phase_rows = [(int(generation), str(phase), float(seconds), int(calls)) for phase, (seconds, calls) in phases.items()]
+        worker_rows = [(int(generation), int(worker), int(tasks), float(busy), float(utilization))
+                       for worker, (tasks, busy, utilization) in workers.items()]
+        def job(conn):
+            with conn:
+                conn.executemany("INSERT INTO profile (generation, phase, seconds, calls) VALUES (?, ?, ?, ?)", phase_rows)
+                conn.executemany("INSERT INTO profile_workers (generation, worker, tasks, busy, utilization) VALUES (?, ?, ?, ?, ?)", worker_rows)
+        self._submit(job)
+
+    def write_maps(self, generation, seeds):
+        """Save the seeds of the map pool drawn for a generation"""
+        rows = [(int(generation), i, int(seed)) for i, seed in enumerate(seeds)]
+        def job(conn):
+            with conn:
+                conn.executemany("INSERT INTO maps (generation, map, seed) VALUES (?, ?, ?)", rows)
+        self._submit(job)
+
+    def discard_from(self, generation):
+        """Delete the results of the given and later generations, used when a run is resumed"""
+        def job(conn):
+            with conn:
+                conn.execute("DELETE FROM results WHERE generation >= ?", (int(generation),))
+                conn.execute("DELETE FROM maps WHERE generation >= ?", (int(generation),))
+                conn.execute("DELETE FROM generation_stats WHERE generation >= ?", (int(generation),))
+                conn.execute("DELETE FROM solution_means WHERE generation >= ?", (int(generation),))
+                conn.execute("DELETE FROM profile WHERE generation >= ?", (int(generation),))
+                conn.execute("DELETE FROM profile_workers WHERE generation >= ?", (int(generation),))
+        self._submit(job)
+
+    def after_writes(self, fn):
+        """Call fn() in the writer thread once all the writes submitted so far are committed"""
+        self._submit(lambda conn: fn())
+
+    def close(self, raise_error=True):
+        """Flush the pending writes and stop the writer thread. The error of the writer thread is raised
+        unless raise_error is False (e.g. when another exception is already propagating)."""
+        self.jobs.put(None)
+        self.thread.join()
+        if raise_error and self.error is not None:
+            raise RuntimeError(f"Results writer failed: {self.error!r}") from self.error
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade training databases in place (WAL mode, games, version and fidelity columns, indexes and generation_stats).")
+    parser.add_argument("dbs", nargs="*", help="Databases to upgrade (default: data/*.sqlite3)")
+    parser.add_argument("--codec", type=str, help="Also rewrite the solutions with this storage codec, e.g. float32, delta32+zlib (see solution_codec.py)")
+    args = parser.parse_args()
+    db_paths = args.dbs or sorted(glob.glob("data/*.sqlite3"))
+    for db_path in db_paths:
+        added = upgrade_db(db_path)
+        print(f"Upgraded {db_path} ({added} generation_stats rows backfilled)")
+        if args.codec is not None:
+            conn = connect(db_path)
+            try:
+                before = db_bytes(conn)
+                migrate_solutions(conn, args.codec)
+                print(f"Rewrote the solutions of {db_path} with {args.codec}: {before / 1e6:.1f} MB -> {db_bytes(conn) / 1e6:.1f} MB")
+            finally:
+                conn.close()
+
+if __name__ == "__main__":
+    main()
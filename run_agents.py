@@ -1,14 +1,16 @@
 import sys
 import argparse
 import importlib
+import time
 
 PW_PYTHON_PATH = "planet-wars-rts/app/src/main/python"
 if PW_PYTHON_PATH not in sys.path:
 	sys.path.insert(0, PW_PYTHON_PATH)
 
 from core.game_runner import GameRunner  # type: ignore
-from core.game_state import GameParams, Player  # type: ignore
+from core.game_state import GameParams, GameState, Player  # type: ignore
 from core.forward_model import ForwardModel  # type: ignore
+from profiler import PROFILE, TraceWriter, format_phases, instrument
 
 def load_agent(class_path: str):
 	"""
@@ -29,6 +31,7 @@ def parse_args():
     parser.add_argument("--agent2", type=str, default="agents.greedy_heuristic_agent.GreedyHeuristicAgent", help="Agent 2 class (module.ClassName). Default: agents.greedy_heuristic_agent.GreedyHeuristicAgent")
     parser.add_argument("--n-games", type=int, default=200, help="Number of games to run. Default: 200")
     parser.add_argument("--num-planets", type=int, default=12, help="Number of planets in the map. Default: 12")
+    parser.add_argument("--profile", nargs="?", const="run_agents.trace.json", default=None, help="Time the phases of the games and write a trace file. Default file: run_agents.trace.json")
     return parser.parse_args()
 
 def main():
@@ -41,6 +44,16 @@ def main():
 	print("AGENT 1:", agent1.get_agent_type())
 	print("AGENT 2:", agent2.get_agent_type())
 	print("=" * 50)
+	if args.profile is not None:
+		# The time of each agent includes the phases inside it, e.g. the features and inference of a SharpAgent
+		instrument(agent1, "get_action", "agent1")
+		instrument(agent2, "get_action", "agent2")
+		instrument(ForwardModel, "step", "forward_model")
+		instrument(GameState, "model_copy", "state_copy")
+		if "agent_runtime" in sys.modules:  # One of the agents is a neural network agent
+			sys.modules["agent_runtime"].profile_agent()
+		trace = TraceWriter(args.profile)
+	start = time.time()
 	# Configure the game parameters with the given number of planets
 	game_params = GameParams(num_planets=args.num_planets)
 	runner = GameRunner(agent1, agent2, game_params)
@@ -48,7 +61,10 @@ def main():
 	# Run the games and count the wins for each player
 	scores = {Player.Player1: 0, Player.Player2: 0, Player.Neutral: 0}
 	for i in range(args.n_games):
+		game_start = time.time()
 		final_model = runner.run_game()
+		if args.profile is not None:
+			PROFILE.add_span(f"game {i+1}", game_start, time.time())
 		winner = final_model.get_leader()
 		scores[winner] += 1
 
@@ -69,6 +85,14 @@ def main():
 	if ForwardModel.n_updates > 0:
 		print(f"Successful actions: {ForwardModel.n_actions}")
 		print(f"Failed actions: {ForwardModel.n_failed_actions}")
+	if args.profile is not None:
+		elapsed = time.time() - start
+		data = PROFILE.take()
+		print(f"Profile ({elapsed:.2f}s, {args.n_games / elapsed:.1f} games/s): {format_phases(data, elapsed)}")
+		trace.write_spans(data["spans"])
+		trace.write_counters("phase seconds", data["seconds"])
+		trace.close()
+		print(f"Trace written to {args.profile}")
 
 if __name__ == "__main__":
 	main()
@@ -14,9 +14,14 @@ if [ "$MODE" = "headless" ]; then
 else
   echo "Killing the existing server"
   pkill -f "client_server/game_agent_server.py" 2>/dev/null || true
+  pkill -f "sharp_agent_server.py" 2>/dev/null || true
 
   echo "Starting the new server"
-  python3 planet-wars-rts/app/src/main/python/client_server/game_agent_server.py &
+  if [ "$MODE" = "batched" ]; then
+    python3 sharp_agent_server.py &
+  else
+    python3 planet-wars-rts/app/src/main/python/client_server/game_agent_server.py &
+  fi
   sleep 5
 
   echo "Running the agents"
@@ -0,0 +1,79 @@
+"""Multi-fidelity screening: a few games, and a surrogate of the past results, decide which candidates get the full game budget."""
+
+import numpy as np
+
+# Fidelity of a result row: estimated by the surrogate only, from the screening games, or from the full game budget
+FIDELITY_SURROGATE = 0
+FIDELITY_SCREENING = 1
+FIDELITY_FULL = 2
+
+def prior_strength(wins, games):
+    """Strength s of the Beta(m * s, (1 - m) * s) prior of the win ratios of a population (empirical Bayes).
+    The spread of the true win ratios is the spread of the observed ratios minus their binomial noise."""
+    played = np.asarray(games) > 0
+    if played.sum() < 2:
+        return 1.0
+    n = np.asarray(games, dtype=np.float64)[played]
+    p = np.asarray(wins, dtype=np.float64)[played] / n
+    m = float(np.clip(p.mean(), 0.01, 0.99))
+    true_var = p.var(ddof=1) - float(np.mean(m * (1.0 - m) / n))
+    if true_var <= 0:  # The candidates can not be told apart from their screening games
+        return 1e6
+    return float(np.clip(m * (1.0 - m) / true_var - 1.0, 1.0, 1e6))
+
+def estimate_win_ratios(wins, games, predicted=None):
+    """Expected win ratio of every candidate over the full game budget, given its wins in the games it played.
+    The ratios are shrunk towards the surrogate predictions, or towards the mean of the population, with a prior
+    whose strength comes from the spread of the population, so a few lucky games do not make a candidate the best."""
+    wins = np.asarray(wins, dtype=np.float64)
+    games = np.asarray(games, dtype=np.float64)
+    if predicted is not None:
+        prior_mean = np.clip(np.asarray(predicted, dtype=np.float64), 0.01, 0.99)
+    elif games.sum() > 0:
+        prior_mean = np.full(wins.shape, np.clip(wins.sum() / games.sum(), 0.01, 0.99))
+    else:
+        return np.full(wins.shape, np.nan)  # Nothing is known about the candidates
+    s = prior_strength(wins, games)
+    return (wins + prior_mean * s) / (games + s)
+
+class Surrogate:
+    """Predicts the win ratio of a solution from the last window fully evaluated candidates.
+
+    A kernel ridge regression with a linear kernel on the solutions centered on the window mean, solved in
+    its dual form: the window has hundreds of rows while a solution has thousands of weights. The CMA-ES
+    samples around its mean, so a local linear model is what the window can support. It is refitted after
+    every generation, which costs a (window, window) solve.
+    """
+    def __init__(self, window, ridge=1.0):
+        self.window = int(window)
+        self.ridge = float(ridge)  # Relative to the mean diagonal of the kernel matrix
+        self.X = None
+        self.y = None
+        self.model = None  # (center, X - center, dual coefficients, mean of y)
+
+    def __len__(self):
+        return 0 if self.y is None else len(self.y)
+
+    def add(self, solutions, win_ratios):
+        """Add fully evaluated candidates, keeping the last window of them"""
+        X = np.asarray(solutions, dtype=np.float64)
+        y = np.asarray(win_ratios, dtype=np.float64)
+        if len(y) == 0:
+            return
+        self.X = (X if self.X is None else np.concatenate([self.X, X]))[-self.window:]
+        self.y = (y if self.y is None else np.concatenate([self.y, y]))[-self.window:]
+        center = self.X.mean(axis=0)
+        Xc = self.X - center
+        K = Xc @ Xc.T
+        lam = self.ridge * max(float(np.trace(K)) / len(self.y), 1e-12)
+        y_mean = float(self.y.mean())
+        alpha = np.linalg.solve(K + lam * np.eye(len(self.y)), self.y - y_mean)
+        self.model = (center, Xc, alpha, y_mean)
+
+    def predict(self, solutions, min_rows=1):
+        """The predicted win ratios of the solutions, None until the window has min_rows candidates"""
+        if self.model is None or len(self) < min_rows:
+            return None
+        center, Xc, alpha, y_mean = self.model
+        K = (np.asarray(solutions, dtype=np.float64) - center) @ Xc.T
+        return np.clip(y_mean + K @ alpha, 0.0, 1.0)
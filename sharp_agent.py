@@ -1,28 +1,33 @@
-import numpy as np
-from train_nn import NeuralNetwork, NeuralPlanetWarsAgent
+import os
+from agent_runtime import NeuralPlanetWarsAgent, make_network  # NumPy only, the training dependencies are not imported
+from weight_file import flat_solution, load_agent_file
 
-AGENT_FILE = "sharp_agent_weights.npy"
+AGENT_FILE = "sharp_agent_weights.pwnn"
+LEGACY_AGENT_FILE = "sharp_agent_weights.npy"  # Agents extracted before the .pwnn weight files
 
-def load_agent_data(data_file=AGENT_FILE):
-    data = np.load(data_file, allow_pickle=True)
-    data = data.item()
-    return data
+def load_agent_data(data_file=None):
+    """The agent dict of a weight file, by default AGENT_FILE or LEGACY_AGENT_FILE when there is none"""
+    if data_file is None:
+        data_file = AGENT_FILE if os.path.exists(AGENT_FILE) else LEGACY_AGENT_FILE
+    return load_agent_file(data_file)
 
-def build_agent(agent_dict):
+def build_agent(agent_dict, backend="numpy"):
     num_planets = int(agent_dict["num_planets"])
     num_features = int(agent_dict["num_features"])
     hidden_sizes = list(agent_dict["hidden_sizes"])
-    weights = np.asarray(agent_dict["solution"], dtype=np.float64)
 
     input_dim = num_planets * num_features
     output_dim = num_planets + 2
 
-    model = NeuralNetwork(input_dim, output_dim, hidden_sizes)
-    model.set_model_weights(weights)
+    model = make_network(input_dim, output_dim, hidden_sizes, backend)
+    if "weights" in agent_dict and getattr(model, "dtype", None) == agent_dict["weights"][0].dtype:
+        model.set_layers(agent_dict["weights"], agent_dict["biases"])  # The layers of a weight file are used in place
+    else:
+        model.set_model_weights(flat_solution(agent_dict))
     return model
 
 class SharpAgent(NeuralPlanetWarsAgent):
-    def __init__(self, data_file=AGENT_FILE):
-        agent_dict = load_agent_data(data_file)
-        model = build_agent(agent_dict)
+    def __init__(self, data_file=None, backend="numpy", model=None):
+        if model is None:  # Agents that share one network (e.g. in sharp_agent_server.py) pass it in
+            model = build_agent(load_agent_data(data_file), backend)
         super().__init__(model)
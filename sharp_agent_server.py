@@ -0,0 +1,201 @@
+"""Websocket agent server that plays SharpAgent in many remote games at once with batched inference.
+
+It speaks the protocol of the Planet Wars game_agent_server.py (init / invoke / end requests), so the
+Kotlin RemoteAgent can connect to it. The get_action requests of all the connected games are gathered
+for at most --max-wait-ms or until --max-batch requests are waiting, and answered with one batched
+forward pass of the shared network.
+"""
+
+import sys
+import argparse
+import asyncio
+import collections
+import json
+import time
+import uuid
+import numpy as np
+import websockets
+
+# Adding the python bindings of Planet Wars to the path
+PW_PYTHON_PATH = "planet-wars-rts/app/src/main/python"
+if PW_PYTHON_PATH not in sys.path:
+    sys.path.insert(0, PW_PYTHON_PATH)
+
+from client_server.util import RemoteInvocationRequest, RemoteInvocationResponse, deserialize_args, serialize_result  # type: ignore
+from core.game_state import camel_to_snake  # type: ignore
+from sharp_agent import AGENT_FILE, LEGACY_AGENT_FILE, SharpAgent, build_agent, load_agent_data
+
+class InferenceBatcher:
+    """Gathers the feature matrices of the waiting games and runs one forward pass over all of them"""
+    def __init__(self, model, max_batch, max_wait):
+        self.model = model
+        self.max_batch = int(max_batch)
+        self.max_wait = float(max_wait)  # Seconds the first request of a batch may wait for others
+        self.queue = asyncio.Queue()
+        self.batch = None  # The stacked feature matrices, reused across batches
+        self.batches = 0
+        self.batched_requests = 0
+        self.max_seen = 0
+
+    async def infer(self, features):
+        """Network outputs (noop, planet logits, ratio) of one flat feature vector"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((features, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            waiting = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(waiting) < self.max_batch:
+                if not self.queue.empty():  # Take what is already queued without waiting
+                    waiting.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    waiting.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                self._forward(waiting)
+            except Exception as e:  # The batcher must outlive any batch, or every later infer() waits forever
+                print(f"Inference batch failed: {e!r}")
+                for _, future in waiting:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _forward(self, waiting):
+        # Requests whose feature vector does not have the size of most of the batch are rejected on their own
+        size = collections.Counter(features.size for features, _ in waiting).most_common(1)[0][0]
+        for features, future in waiting:
+            if features.size != size and not future.done():
+                future.set_exception(ValueError(f"Expected {size} features, got {features.size}"))
+        waiting = [(features, future) for features, future in waiting if features.size == size]
+        K = len(waiting)
+        if self.batch is None or self.batch.shape[0] < K or self.batch.shape[1] != size:
+            self.batch = np.zeros((max(K, self.max_batch), size), dtype=np.float32)
+        try:
+            for k, (features, _) in enumerate(waiting):
+                self.batch[k] = features
+            noops, logits, ratios = self.model.forward_batch(self.batch[:K])
+            logits = np.array(logits)  # The network buffers are reused by the next batch
+        except Exception as e:
+            for _, future in waiting:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for k, (_, future) in enumerate(waiting):
+            if not future.done():  # The game may have disconnected in the meantime
+                future.set_result((float(noops[k]), logits[k], float(ratios[k])))
+        self.batches += 1
+        self.batched_requests += K
+        self.max_seen = max(self.max_seen, K)
+
+class BatchedAgentServer:
+    """Serves SharpAgent to remote games, every game gets its own agent state around one shared network"""
+    def __init__(self, host, port, data_file, backend, max_batch, max_wait, stats_every):
+        self.host = host
+        self.port = port
+        self.model = build_agent(load_agent_data(data_file), backend)  # Loaded once for all the games
+        self.batcher = InferenceBatcher(self.model, max_batch, max_wait)
+        self.stats_every = float(stats_every)
+        self.agent_map = {}
+        self.started = time.perf_counter()
+        self.requests = collections.Counter()  # Number of requests of every method
+        self.latencies = collections.deque(maxlen=10000)  # Seconds from receiving a get_action to its reply
+        self.errors = 0
+
+    async def get_action(self, agent, args):
+        """Batched version of agent.get_action"""
+        (game_state,) = deserialize_args(agent.get_action, args)
+        M = agent.features.extract(game_state, agent.params, agent.player)
+        noop, logits, ratio = await self.batcher.infer(M.reshape(-1))
+        return agent.choose_action(game_state, noop, logits, ratio)
+
+    async def handle(self, request):
+        if request.requestType == "init":
+            agent_id = str(uuid.uuid4())
+            self.agent_map[agent_id] = SharpAgent(model=self.model)  # The network is shared, not reloaded
+            return {"objectId": agent_id}
+        if request.requestType == "invoke":
+            agent = self.agent_map.get(request.objectId)
+            if agent is None:
+                raise ValueError(f"Unknown objectId: {request.objectId}")
+            method_name = camel_to_snake(request.method)
+            self.requests[method_name] += 1
+            if method_name == "get_action":
+                start = time.perf_counter()
+                result = await self.get_action(agent, request.args)
+                self.latencies.append(time.perf_counter() - start)
+            else:
+                method = getattr(agent, method_name)
+                result = method(*deserialize_args(method, request.args))
+            return serialize_result(result)
+        if request.requestType == "end":
+            self.agent_map.pop(request.objectId, None)
+            return {"status": "ended"}
+        if request.requestType == "stats":
+            return self.stats()
+        raise ValueError(f"Unknown request type: {request.requestType}")
+
+    async def handler(self, websocket):
+        async for message in websocket:
+            try:
+                request = RemoteInvocationRequest(**json.loads(message))
+                response = RemoteInvocationResponse(status="ok", result=await self.handle(request))
+            except Exception as e:
+                self.errors += 1
+                response = RemoteInvocationResponse(status="error", error=str(e))
+            await websocket.send(response.model_dump_json())
+
+    def stats(self):
+        """Latency and throughput counters of the server"""
+        elapsed = time.perf_counter() - self.started
+        batcher = self.batcher
+        latencies = np.asarray(self.latencies, dtype=np.float64) * 1000.0
+        return {
+            "uptime_s": elapsed,
+            "games": len(self.agent_map),
+            "requests": dict(self.requests),
+            "errors": self.errors,
+            "actions_per_s": self.requests["get_action"] / elapsed if elapsed > 0 else 0.0,
+            "batches": batcher.batches,
+            "mean_batch": batcher.batched_requests / batcher.batches if batcher.batches else 0.0,
+            "max_batch": batcher.max_seen,
+            "latency_ms": {f"p{q}": float(np.percentile(latencies, q)) for q in (50, 90, 99)} if latencies.size else {},
+        }
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.stats_every)
+            s = self.stats()
+            latency = s["latency_ms"]
+            print(f"games={s['games']}\tactions/s={s['actions_per_s']:.1f}\tmean batch={s['mean_batch']:.1f}\t"
+                  f"p50={latency.get('p50', 0.0):.2f}ms\tp99={latency.get('p99', 0.0):.2f}ms\terrors={s['errors']}")
+
+    async def start(self):
+        tasks = [asyncio.create_task(self.batcher.run())]  # Keep references, the loop only holds weak ones
+        if self.stats_every > 0:
+            tasks.append(asyncio.create_task(self.report()))
+        async with websockets.serve(self.handler, self.host, self.port):
+            print(f"Serving SharpAgent on ws://{self.host}:{self.port}")
+            await asyncio.Future()  # Run forever
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve SharpAgent to many remote games with batched inference.")
+    parser.add_argument("--host", type=str, default="localhost", help="Host to listen on (default: localhost)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("--weights", type=str, default=None, help=f"Weights of the agent (default: {AGENT_FILE}, or {LEGACY_AGENT_FILE} without it)")
+    parser.add_argument("--backend", type=str, default="numpy", help="Inference backend: torch, numpy or numpy64 (default: numpy)")
+    parser.add_argument("--max-batch", type=int, default=64, help="Most get_action requests answered by one forward pass (default: 64)")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="Longest a request waits for others to batch with (default: 2.0)")
+    parser.add_argument("--stats-every", type=float, default=10.0, help="Seconds between two printed stats lines, 0 disables them (default: 10)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = BatchedAgentServer(args.host, args.port, args.weights, args.backend, args.max_batch, args.max_wait_ms / 1000.0, args.stats_every)
+    asyncio.run(server.start())
@@ -0,0 +1,84 @@
+"""Storage codecs of the results.solution BLOBs of the training databases.
+
+A codec is a value type optionally followed by a compressor, e.g. "float32+zlib":
+- float64: the raw solution (the format of older runs)
+- float32: the solution rounded to float32
+- delta32: the difference to the mean of the generation in float32, the float64 means are
+  stored in the solution_means table
+- +zlib / +lz4: the bytes are shuffled (all the first bytes of the values, then the second bytes...)
+  and compressed, lz4 requires the lz4 package
+The codec of a run is saved in its config as solution_codec and solution_codec_version.
+"""
+
+import zlib
+import numpy as np
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # lz4 is optional, the other codecs work without it
+    lz4_frame = None
+
+CODEC_VERSION = 1
+DEFAULT_CODEC = "float64"  # Runs without a solution_codec in their config
+VALUE_TYPES = {"float64": "<f8", "float32": "<f4", "delta32": "<f4"}
+COMPRESSORS = ["zlib", "lz4"]
+
+class SolutionCodec:
+    """Encodes the solutions of a generation into BLOBs and decodes them back into float64 arrays"""
+    def __init__(self, spec=DEFAULT_CODEC):
+        self.spec = str(spec)
+        value_type, _, compressor = self.spec.partition("+")
+        if value_type not in VALUE_TYPES:
+            raise ValueError(f"Unknown solution codec {self.spec!r}, the value type must be one of {list(VALUE_TYPES)}")
+        if compressor and compressor not in COMPRESSORS:
+            raise ValueError(f"Unknown solution codec {self.spec!r}, the compressor must be one of {COMPRESSORS}")
+        if compressor == "lz4" and lz4_frame is None:
+            raise ValueError("The lz4 solution codec requires the lz4 package (pip install lz4)")
+        self.dtype = np.dtype(VALUE_TYPES[value_type])
+        self.uses_mean = value_type == "delta32"  # Decoding needs the mean of the generation
+        self.compressor = compressor or None
+
+    def generation_mean(self, solutions):
+        """The float64 mean the solutions are stored relative to, None when the codec does not use it"""
+        if not self.uses_mean:
+            return None
+        return np.mean(np.asarray(solutions, dtype=np.float64), axis=0)
+
+    def encode(self, solution, mean=None):
+        values = np.asarray(solution, dtype=np.float64)
+        if self.uses_mean:
+            values = values - mean
+        raw = values.astype(self.dtype)
+        if self.compressor is None:
+            return raw.tobytes()
+        shuffled = raw.view(np.uint8).reshape(-1, self.dtype.itemsize).T.tobytes()  # Groups the similar bytes together
+        return zlib.compress(shuffled, 6) if self.compressor == "zlib" else lz4_frame.compress(shuffled)
+
+    def decode(self, blob, mean=None):
+        if self.compressor is None:
+            values = np.frombuffer(blob, dtype=self.dtype)
+        else:
+            shuffled = zlib.decompress(blob) if self.compressor == "zlib" else lz4_frame.decompress(blob)
+            values = np.frombuffer(shuffled, dtype=np.uint8).reshape(self.dtype.itemsize, -1).T.copy().view(self.dtype).reshape(-1)
+        values = values.astype(np.float64)
+        if self.uses_mean:
+            if mean is None:
+                raise ValueError(f"Solutions stored with {self.spec!r} need the mean of their generation")
+            values += mean
+        return values
+
+def codec_from_config(cfg):
+    """The codec of a run from its config table, older runs have raw float64 solutions"""
+    version = int(cfg.get("solution_codec_version", CODEC_VERSION))
+    if version > CODEC_VERSION:
+        raise RuntimeError(f"Solution codec version {version} is newer than the supported version {CODEC_VERSION}")
+    return SolutionCodec(cfg.get("solution_codec", DEFAULT_CODEC))
+
+def read_mean(conn, generation):
+    """The float64 mean of a generation that delta-coded solutions are relative to"""
+    row = conn.execute("SELECT mean FROM solution_means WHERE generation = ?", (int(generation),)).fetchone()
+    return None if row is None else np.frombuffer(row[0], dtype=np.float64)
+
+def decode_solution(conn, codec, generation, blob):
+    """Decode the solution BLOB of a generation, reading the generation mean when the codec needs it"""
+    return codec.decode(blob, read_mean(conn, generation) if codec.uses_mean else None)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The tests import the modules of the repository root and the Planet Wars bindings (setup.sh)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "planet-wars-rts", "app", "src", "main", "python")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
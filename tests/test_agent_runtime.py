@@ -0,0 +1,49 @@
+"""PlanetFeatureExtractor must give exactly the features of build_planet_matrix."""
+
+import random
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+agent_runtime = pytest.importorskip("agent_runtime", reason="requires the Planet Wars bindings (setup.sh)")
+from core.game_state import GameParams, Player  # type: ignore
+
+def random_game(rng, num_planets, params):
+    """The fixed planets of a game and a function that draws random states of it"""
+    layout = [(rng.uniform(0, params.width), rng.uniform(0, params.height), rng.choice([1, 2, 3, 4, 5, 6]))
+              for _ in range(num_planets)]
+    def state():
+        planets = []
+        for i, (x, y, growth) in enumerate(layout):
+            transporter = None
+            if rng.random() < 0.4:  # Fleets of both players (and the odd neutral one) towards any planet
+                transporter = SimpleNamespace(
+                    owner=rng.choice([Player.Player1, Player.Player2, Player.Player2, Player.Neutral]),
+                    destination_index=rng.randrange(num_planets), n_ships=rng.uniform(0, 300),
+                    s=SimpleNamespace(x=rng.uniform(0, params.width), y=rng.uniform(0, params.height)),
+                    v=SimpleNamespace(x=rng.uniform(-3, 3), y=rng.uniform(-3, 3)))
+            planets.append(SimpleNamespace(
+                id=i, owner=rng.choice([Player.Player1, Player.Player2, Player.Neutral]),
+                n_ships=rng.choice([rng.uniform(0, 400), float(rng.randrange(5))]),  # Includes ties and more than 200 ships
+                position=SimpleNamespace(x=x, y=y), growth_rate=growth, transporter=transporter))
+        return SimpleNamespace(planets=planets)
+    return state
+
+@pytest.mark.parametrize("me", [Player.Player1, Player.Player2])
+def test_extractor_matches_build_planet_matrix(me):
+    rng = random.Random(1)
+    params = GameParams(num_planets=12)
+    extractor = agent_runtime.PlanetFeatureExtractor()
+    for num_planets in (12, 12, 7, 20):  # A new game every time, some with another number of planets
+        extractor.reset()
+        next_state = random_game(rng, num_planets, params)
+        for _ in range(150):
+            state = next_state()
+            expected = agent_runtime.build_planet_matrix(state, params, me)
+            features = extractor.extract(state, params, me)
+            assert features.dtype == expected.dtype
+            assert np.array_equal(features, expected)
+
+            idle = [p for p in state.planets if p.owner == me and p.transporter is None]
+            largest = state.planets.index(max(idle, key=lambda p: float(p.n_ships))) if idle else -1
+            assert extractor.largest_idle() == largest
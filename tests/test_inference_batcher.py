@@ -0,0 +1,60 @@
+"""InferenceBatcher must answer every request of a batch, and keep serving after a bad one."""
+
+import asyncio
+import numpy as np
+import pytest
+
+pytest.importorskip("websockets")
+sharp_agent_server = pytest.importorskip("sharp_agent_server", reason="requires the Planet Wars bindings (setup.sh)")
+
+class SumModel:
+    """Stands in for the network: the outputs of a row are its sum, the row itself and its mean"""
+    def __init__(self):
+        self.fail = False
+
+    def forward_batch(self, X):
+        if self.fail:
+            raise RuntimeError("forward pass failed")
+        return X.sum(axis=1), X, X.mean(axis=1)
+
+async def serve(model, body):
+    batcher = sharp_agent_server.InferenceBatcher(model, max_batch=8, max_wait=0.05)
+    task = asyncio.create_task(batcher.run())
+    try:
+        return await asyncio.wait_for(body(batcher), 5.0)  # A hung batcher fails the test instead of blocking it
+    finally:
+        task.cancel()
+
+def test_mixed_sizes_reject_only_the_mismatched_requests():
+    sizes = [4, 4, 3, 4, 5, 4]
+    vectors = [np.arange(n, dtype=np.float32) + k for k, n in enumerate(sizes)]
+
+    async def body(batcher):
+        results = await asyncio.gather(*(batcher.infer(v) for v in vectors), return_exceptions=True)
+        after = await batcher.infer(np.ones(4, dtype=np.float32))  # The batcher still serves later requests
+        return results, after, batcher.batches
+
+    results, after, batches = asyncio.run(serve(SumModel(), body))
+    for v, result in zip(vectors, results):
+        if v.size == 4:
+            noop, logits, ratio = result
+            assert noop == pytest.approx(float(v.sum()))
+            np.testing.assert_array_equal(logits, v)
+            assert ratio == pytest.approx(float(v.mean()))
+        else:
+            assert isinstance(result, ValueError)
+    assert after[0] == pytest.approx(4.0)
+    assert batches >= 2
+
+def test_failed_forward_pass_does_not_stop_the_batcher():
+    model = SumModel()
+
+    async def body(batcher):
+        model.fail = True
+        with pytest.raises(RuntimeError):
+            await batcher.infer(np.ones(4, dtype=np.float32))
+        model.fail = False
+        return await batcher.infer(np.ones(4, dtype=np.float32))
+
+    noop, _, _ = asyncio.run(serve(model, body))
+    assert noop == pytest.approx(4.0)
@@ -0,0 +1,60 @@
+"""The NumPy inference must match torch_network.NeuralNetwork within rtol = atol = 1e-5."""
+
+import numpy as np
+import pytest
+from numpy_network import NumpyNetwork, PopulationNetwork
+
+torch_network = pytest.importorskip("torch_network", reason="requires torch")
+
+INPUT_DIM, OUTPUT_DIM, HIDDEN_SIZES = 12 * 11, 12 + 2, [32, 16, 8]
+TOL = dict(rtol=1e-5, atol=1e-5)
+
+def torch_model(rng):
+    """A torch network with its initial weights moved like a CMA-ES sample"""
+    model = torch_network.NeuralNetwork(INPUT_DIM, OUTPUT_DIM, HIDDEN_SIZES)
+    theta0 = model.get_model_weights().astype(np.float64)
+    theta = theta0 + 0.5 * rng.standard_normal(theta0.size)
+    model.set_model_weights(theta.astype(np.float32))
+    return model.eval(), theta
+
+def features(rng, k):
+    return rng.uniform(-1.0, 1.0, size=(k, INPUT_DIM)).astype(np.float32)
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_forward_outputs_matches_torch(dtype):
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        model, theta = torch_model(rng)
+        network = NumpyNetwork(INPUT_DIM, OUTPUT_DIM, HIDDEN_SIZES, dtype=dtype)
+        network.set_model_weights(theta.astype(np.float32))  # The weights the torch model holds
+        assert np.array_equal(network.get_model_weights(), theta.astype(np.float32).astype(dtype))
+        for x in features(rng, 20):
+            noop, logits, ratio = network.forward_outputs(x)
+            t_noop, t_logits, t_ratio = model.forward_outputs(x)
+            np.testing.assert_allclose(noop, t_noop, **TOL)
+            np.testing.assert_allclose(logits, t_logits, **TOL)
+            np.testing.assert_allclose(ratio, t_ratio, **TOL)
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_forward_batch_matches_torch(dtype):
+    rng = np.random.default_rng(1)
+    model, theta = torch_model(rng)
+    network = NumpyNetwork(INPUT_DIM, OUTPUT_DIM, HIDDEN_SIZES, dtype=dtype)
+    network.set_model_weights(theta.astype(np.float32))
+    for k in (1, 8, 3):  # Batch sizes with their own buffers, reused in any order
+        batch = features(rng, k)
+        for ours, theirs in zip(network.forward_batch(batch), model.forward_batch(batch)):
+            np.testing.assert_allclose(ours, theirs, **TOL)
+
+def test_population_network_matches_torch():
+    rng = np.random.default_rng(2)
+    models, thetas = zip(*(torch_model(rng) for _ in range(4)))
+    network = PopulationNetwork(INPUT_DIM, OUTPUT_DIM, HIDDEN_SIZES, popsize=4)
+    network.set_population_weights(np.stack(thetas).astype(np.float32))
+    batch = np.stack([features(rng, 6) for _ in range(4)])  # (popsize, K, input_dim), other games for every candidate
+    noops, logits, ratios = network.forward_batch(batch)
+    for p, model in enumerate(models):
+        t_noops, t_logits, t_ratios = model.forward_batch(batch[p])
+        np.testing.assert_allclose(noops[p], t_noops, **TOL)
+        np.testing.assert_allclose(logits[p], t_logits, **TOL)
+        np.testing.assert_allclose(ratios[p], t_ratios, **TOL)
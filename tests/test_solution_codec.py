@@ -0,0 +1,60 @@
+"""The solution codecs must give back the stored solutions, exactly or within their float32 rounding."""
+
+import numpy as np
+import pytest
+from results_db import ResultsWriter, connect
+from solution_codec import SolutionCodec, codec_from_config, decode_solution, lz4_frame
+
+SPECS = ["float64", "float32", "delta32", "float64+zlib", "float32+zlib", "delta32+zlib"]
+if lz4_frame is not None:
+    SPECS += ["float64+lz4", "delta32+lz4"]
+
+def population(seed=0, popsize=10, dim=5046):
+    rng = np.random.default_rng(seed)
+    mean = rng.standard_normal(dim) * 3.0
+    return [mean + 0.5 * rng.standard_normal(dim) for _ in range(popsize)]
+
+@pytest.mark.parametrize("spec", SPECS)
+def test_round_trip(spec):
+    codec = SolutionCodec(spec)
+    solutions = population()
+    mean = codec.generation_mean(solutions)
+    for sol in solutions:
+        decoded = codec.decode(codec.encode(sol, mean), mean)
+        assert decoded.dtype == np.float64
+        if spec.startswith("float64"):
+            assert np.array_equal(decoded, sol)
+        elif spec.startswith("float32"):
+            assert np.array_equal(decoded, sol.astype(np.float32).astype(np.float64))
+        else:  # Only the difference to the mean is rounded to float32
+            assert np.array_equal(decoded, (sol - mean).astype(np.float32).astype(np.float64) + mean)
+            assert np.max(np.abs(decoded - sol)) < 1e-6
+
+def test_unknown_specs():
+    for spec in ("float16", "float32+gzip"):
+        with pytest.raises(ValueError):
+            SolutionCodec(spec)
+    with pytest.raises(RuntimeError):
+        codec_from_config({"solution_codec": "float32", "solution_codec_version": "999"})
+
+@pytest.mark.parametrize("spec", ["float64", "delta32+zlib"])
+def test_results_writer_round_trip(tmp_path, spec):
+    db_path = str(tmp_path / "run.sqlite3")
+    codec = SolutionCodec(spec)
+    writer = ResultsWriter(db_path, {"solution_codec": spec}, codec=codec)
+    generations = [population(seed) for seed in range(2)]
+    for gen, solutions in enumerate(generations):
+        writer.write_generation(gen, solutions, [0.5] * len(solutions), [100] * len(solutions))
+    writer.close()
+
+    conn = connect(db_path)
+    try:
+        cfg = {k: v for k, v in conn.execute("SELECT k, v FROM config")}
+        for gen, solutions in enumerate(generations):
+            rows = conn.execute("SELECT individual, solution FROM results WHERE generation = ? ORDER BY individual", (gen,)).fetchall()
+            assert len(rows) == len(solutions)
+            for idx, blob in rows:
+                decoded = decode_solution(conn, codec_from_config(cfg), gen, blob)
+                np.testing.assert_allclose(decoded, solutions[idx], rtol=0, atol=1e-6)
+    finally:
+        conn.close()
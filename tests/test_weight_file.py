@@ -0,0 +1,66 @@
+"""The .pwnn weight files must give back the agent they were written from."""
+
+import struct
+import numpy as np
+import pytest
+from numpy_network import NumpyNetwork
+from weight_file import ALIGN, FORMAT_VERSION, PREFIX, flat_solution, layer_sizes, load_agent_file, read_weight_file, save_agent_file
+
+def agent(seed=0, hidden_sizes=(32, 16, 8)):
+    agent_dict = {"num_planets": 12, "num_features": 11, "hidden_sizes": list(hidden_sizes)}
+    sizes = layer_sizes(agent_dict)
+    n = sum(a * b + b for a, b in zip(sizes[:-1], sizes[1:]))
+    agent_dict["solution"] = np.random.default_rng(seed).standard_normal(n) * 2.0
+    return agent_dict
+
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_round_trip(tmp_path, dtype):
+    path = str(tmp_path / "agent.pwnn")
+    original = agent()
+    save_agent_file(path, original, dtype)
+    loaded = read_weight_file(path)
+    assert (loaded["num_planets"], loaded["num_features"], loaded["hidden_sizes"]) == (12, 11, [32, 16, 8])
+    expected = original["solution"] if dtype == "float64" else original["solution"].astype(np.float32).astype(np.float64)
+    assert np.array_equal(flat_solution(loaded), expected)
+    for array in loaded["weights"] + loaded["biases"]:
+        assert isinstance(array.base, np.memmap)  # A view of the mapped file, not a copy
+        assert array.dtype == np.dtype(dtype)
+        assert not array.flags.writeable
+        assert array.ctypes.data % ALIGN == 0
+
+def test_set_layers_matches_set_model_weights(tmp_path):
+    path = str(tmp_path / "agent.pwnn")
+    original = agent(1)
+    save_agent_file(path, original, "float32")
+    loaded = read_weight_file(path)
+    input_dim = 12 * 11
+    mapped = NumpyNetwork(input_dim, 14, original["hidden_sizes"])
+    mapped.set_layers(loaded["weights"], loaded["biases"])
+    copied = NumpyNetwork(input_dim, 14, original["hidden_sizes"])
+    copied.set_model_weights(original["solution"])
+    x = np.random.default_rng(2).uniform(-1, 1, size=(5, input_dim)).astype(np.float32)
+    for a, b in zip(mapped.forward_batch(x), copied.forward_batch(x)):
+        assert np.array_equal(a, b)
+
+def test_legacy_npy(tmp_path):
+    path = str(tmp_path / "agent.npy")
+    original = agent(3)
+    save_agent_file(path, original)
+    loaded = load_agent_file(path)
+    assert np.array_equal(flat_solution(loaded), original["solution"])
+
+def test_rejects_newer_versions_and_other_files(tmp_path):
+    path = str(tmp_path / "agent.pwnn")
+    save_agent_file(path, agent(), "float32")
+    with open(path, "r+b") as f:
+        magic, _, header_len = PREFIX.unpack(f.read(PREFIX.size))
+        f.seek(0)
+        f.write(PREFIX.pack(magic, FORMAT_VERSION + 1, header_len))
+    with pytest.raises(ValueError):
+        read_weight_file(path)
+    other = tmp_path / "other.pwnn"
+    other.write_bytes(struct.pack("<4sII", b"NOPE", 1, 0) + b"\0" * 64)
+    with pytest.raises(ValueError):
+        read_weight_file(str(other))
+    with pytest.raises(ValueError):
+        save_agent_file(path, agent(), "float16")
@@ -0,0 +1,55 @@
+"""The torch network of the agent, used for training and by the torch inference backend."""
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+class NeuralNetwork(nn.Module):
+    """A neural network class for playing the Planet Wars game."""
+    def __init__(self, input_dim, output_dim, hidden_sizes):
+        """Initialize the neural network for the given input and output dimensions"""
+        super().__init__()
+        layers = []  # A list for the layers of the neural network
+        current_layer = input_dim  # The input dimension of the current layer
+        for hidden_layer_size in hidden_sizes:  # For each hidden layer
+            layers.append(nn.Linear(current_layer, hidden_layer_size))
+            layers.append(nn.ReLU())
+            current_layer = hidden_layer_size
+        layers.append(nn.Linear(current_layer, output_dim))
+        self.net = nn.Sequential(*layers)  # Create the neural network as a sequential model
+
+    @torch.no_grad()
+    def forward_outputs(self, flat_vec):
+        """Forward pass through the neural network"""
+        x = torch.from_numpy(flat_vec.astype(np.float32)).unsqueeze(0)  # Convert the flat vector to a tensor
+        y = self.net(x).squeeze(0)  # Forward pass through the neural network
+        noop_logits = float(y[0].item())
+        planet_logits = y[1:-1].cpu().numpy().astype(np.float32)
+        ship_ratio = float(torch.sigmoid(y[-1]).item())
+        return noop_logits, planet_logits, ship_ratio
+
+    @torch.no_grad()
+    def forward_batch(self, batch):
+        """Forward pass for a (K, input_dim) batch, returns the noop logits, planet logits and ratios of each row"""
+        x = torch.from_numpy(np.asarray(batch, dtype=np.float32))
+        y = self.net(x)
+        noop_logits = y[:, 0].numpy()
+        planet_logits = y[:, 1:-1].numpy()
+        ship_ratios = torch.sigmoid(y[:, -1]).numpy()
+        return noop_logits, planet_logits, ship_ratios
+
+    def get_model_weights(self):
+        """Returns a flat numpy array of all model weights and biases"""
+        weights = []
+        for param in self.parameters():  # Iterate through the parameters of the network
+            weights.append(param.detach().cpu().numpy().reshape(-1))  # Add the parameters
+        return np.concatenate(weights, axis=0)  # Merge them
+
+    def set_model_weights(self, flat_weights):
+        """Set the weights of the model that come from a flat numpy array"""
+        prev_ind = 0
+        for param in self.parameters():
+            flat_size = param.numel()  # Get the parameter size
+            new_vals = flat_weights[prev_ind:prev_ind + flat_size].reshape(param.shape)  # Reshape into the parameter size
+            param.data.copy_(torch.from_numpy(new_vals).to(param.dtype))  # Copy the values to the parameter
+            prev_ind += flat_size  # Update the index
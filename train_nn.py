@@ -3,13 +3,15 @@
 import sys
 import cma
 import os
+import random
+import time
 import concurrent.futures as futures
+import multiprocessing
+from multiprocessing import shared_memory
 import numpy as np
 import torch
-import torch.nn as nn
 import yaml
 import argparse
-import sqlite3
 from datetime import datetime
 
 # Adding the python bindings of Planet Wars to the path
@@ -17,241 +19,719 @@ PW_PYTHON_PATH = "planet-wars-rts/app/src/main/python"
 if PW_PYTHON_PATH not in sys.path:
     sys.path.insert(0, PW_PYTHON_PATH)
 
-from core.game_state import Action, GameState, GameParams, Player  # type: ignore
+from core.game_state import GameState, GameParams, Player  # type: ignore
 from core.game_runner import GameRunner  # type: ignore
-from agents.planet_wars_agent import PlanetWarsPlayer  # type: ignore
-
-def build_planet_matrix(state: GameState, params: GameParams, me: Player) -> np.ndarray:
-    """Build a matrix of features of the planets in the game state."""
-    N = len(state.planets)  # Number of planets
-
-    # The game dimensions
-    game_width = params.width
-    game_height = params.height
-
-    # An array for the incoming ships to each planet
-    incoming_friendly = np.zeros((N,), dtype=np.float32)
-    incoming_enemy = np.zeros((N,), dtype=np.float32)
-
-    for planet in state.planets:  # For each planet
-        transporter = planet.transporter  # Transporter to destination planet
-        if transporter is None:  # If there is no transporter, skip
-            continue
-        destination_planet = transporter.destination_index  # The destionation of the transporter
-
-        # If the transporter is owned by me, add the ships to the incoming friendly array
-        if transporter.owner == me:
-            incoming_friendly[destination_planet] += float(transporter.n_ships)
-        # If the transporter is owned by the opponent, add the ships to the incoming enemy array
-        elif transporter.owner == me.opponent():
-            incoming_enemy[destination_planet] += float(transporter.n_ships)
-
-    F = 11
-    M = np.zeros((N, F), dtype=np.float32)
-    for i, p in enumerate(state.planets):
-        tp = p.transporter
-        if tp is not None:  # If there is a transporter, add the position and velocity information to the matrix
-            tp_sx = float(tp.s.x) / game_width
-            tp_sy = float(tp.s.y) / game_height
-            tp_vx = float(tp.v.x) / float(params.transporter_speed)
-            tp_vy = float(tp.v.y) / float(params.transporter_speed)
-        else:  # If there is no transporter, set these values to 0.
-            tp_sx = 0.0
-            tp_sy = 0.0
-            tp_vx = 0.0
-            tp_vy = 0.0
-        
-        # Determine the owner of the planet
-        if p.owner == me:
-            owner_feature = 1
-        elif p.owner == me.opponent():
-            owner_feature = -1
-        elif p.owner == Player.Neutral:
-            owner_feature = 0
-            
-        M[i] = np.array(
-            [
-                owner_feature,
-                min(1.0, float(p.n_ships) / 200.0),
-                min(1.0, float(p.growth_rate) / float(params.max_growth_rate)),
-                float(p.position.x) / game_width,
-                float(p.position.y) / game_height,
-                min(1.0, incoming_friendly[i] / 200.0),
-                min(1.0, incoming_enemy[i] / 200.0),
-                tp_sx, tp_sy,
-                tp_vx, tp_vy,
-            ],
-            dtype=np.float32,
-        )
-
-    return M
+from core.forward_model import ForwardModel  # type: ignore
+from agent_runtime import NeuralPlanetWarsAgent, PlanetFeatureExtractor, build_planet_matrix, make_network, profile_agent
+from torch_network import NeuralNetwork
+from numpy_network import PopulationNetwork
+from racing import Race
+from screening import FIDELITY_FULL, FIDELITY_SCREENING, FIDELITY_SURROGATE, Surrogate, estimate_win_ratios
+from results_db import ResultsWriter, connect_readonly, read_config
+from solution_codec import CODEC_VERSION, SolutionCodec
+from checkpoint import checkpoint_path, make_checkpoint, save_checkpoint, load_checkpoint
+from catalog import catalog_path, open_catalog, update_catalog
+from map_pool import MapPool, decode_state, generate_maps, map_seeds
+from eval_broker import EvaluationBroker, is_loopback
+from profiler import PROFILE, TraceWriter, format_phases, instrument, worker_stats
 
 def load_config():
-    # Load config from the YAML file
+    # Load config from the YAML file, or from the checkpoint of the run to resume
     parser = argparse.ArgumentParser(description="Neural Evolver")
     parser.add_argument("--config", type=str, default="config1.yaml", help="Path to YAML config file")
+    parser.add_argument("--resume", type=str, help="Run database (data/<run>.sqlite3) to resume from its checkpoint")
+    parser.add_argument("--profile", action="store_true", help="Time the phases of every generation, saved to the database and data/<run>.trace.json")
     args = parser.parse_args()
+    if args.resume is not None:
+        ckpt = load_checkpoint(checkpoint_path(args.resume))
+        return ckpt["cfg"], (args.resume, ckpt), args.profile
     current_directory = os.path.dirname(__file__)
     CONFIG_PATH = args.config if os.path.isabs(args.config) else os.path.join(current_directory, args.config)
     with open(CONFIG_PATH, "r") as f:
         cfg = yaml.safe_load(f)
-    return cfg
-
-class NeuralNetwork(nn.Module):
-    """A neural network class for playing the Planet Wars game."""
-    def __init__(self, input_dim, output_dim, hidden_sizes):
-        """Initialize the neural network for the given input and output dimensions"""
-        super().__init__()
-        layers = []  # A list for the layers of the neural network
-        current_layer = input_dim  # The input dimension of the current layer
-        for hidden_layer_size in hidden_sizes:  # For each hidden layer
-            layers.append(nn.Linear(current_layer, hidden_layer_size))
-            layers.append(nn.ReLU())
-            current_layer = hidden_layer_size
-        layers.append(nn.Linear(current_layer, output_dim))
-        self.net = nn.Sequential(*layers)  # Create the neural network as a sequential model
-
-    @torch.no_grad()
-    def forward_outputs(self, flat_vec):
-        """Forward pass through the neural network"""
-        x = torch.from_numpy(flat_vec.astype(np.float32)).unsqueeze(0)  # Convert the flat vector to a tensor
-        y = self.net(x).squeeze(0)  # Forward pass through the neural network
-        noop_logits = float(y[0].item())
-        planet_logits = y[1:-1].cpu().numpy().astype(np.float32)
-        ship_ratio = float(torch.sigmoid(y[-1]).item())
-        return noop_logits, planet_logits, ship_ratio
-
-    def get_model_weights(self):
-        """Returns a flat numpy array of all model weights and biases"""
-        weights = []
-        for param in self.parameters():  # Iterate through the parameters of the network
-            weights.append(param.detach().cpu().numpy().reshape(-1))  # Add the parameters
-        return np.concatenate(weights, axis=0)  # Merge them
-
-    def set_model_weights(self, flat_weights):
-        """Set the weights of the model that come from a flat numpy array"""
-        prev_ind = 0
-        for param in self.parameters():
-            flat_size = param.numel()  # Get the parameter size
-            new_vals = flat_weights[prev_ind:prev_ind + flat_size].reshape(param.shape)  # Reshape into the parameter size
-            param.data.copy_(torch.from_numpy(new_vals).to(param.dtype))  # Copy the values to the parameter
-            prev_ind += flat_size  # Update the index
-
-class NeuralPlanetWarsAgent(PlanetWarsPlayer):
-    """A neural network agent for playing the Planet Wars game"""
-    def __init__(self, model):
-        """Initialize the neural network agent with the given model"""
-        super().__init__()
-        self.model = model.eval()
-
-    def get_action(self, game_state):
-        """Get the next action using the game_state"""
-        M = build_planet_matrix(game_state, self.params, self.player)  # Get the feature matrix
-        flat_M = M.flatten().astype(np.float32)  # Flatten the feature matrix
-
-        noop, logits, ratio = self.model.forward_outputs(flat_M)  # Pass it through the network
-
-        # Find the idle planets that are owned by us. These planets can be used to send transporters. 
-        idle_mine = [p for p in game_state.planets if p.owner == self.player and p.transporter is None]
-        if not idle_mine:  # If there are no idle planets that are owned by us, then do nothing
-            return Action.do_nothing()
-
-        target_idx = int(np.argmax(logits))  # The ID of the target planet
-        if noop >= float(logits[target_idx]):  # If the noop logit is higher than the logit of the target planet
-            return Action.do_nothing()  # again do nothing
-
-        # Find the source planet with the maximum number of ships
-        source_planet = max(idle_mine, key=lambda p: float(p.n_ships))
-        num_ships = int(float(source_planet.n_ships) * ratio)  # Determine the number of ships to send using the ratio
-        if num_ships <= 0:  # If it is less than or equal to 0, do nothing
-            return Action.do_nothing()
-        dest = game_state.planets[target_idx]  # Use the destination planet given by the game state
-        return Action(player_id=self.player,
-                      source_planet_id=source_planet.id,
-                      destination_planet_id=dest.id,
-                      num_ships=num_ships)
-
-    def get_agent_type(self) -> str:
-        return "evolved_nn"
+    return cfg, None, args.profile
+
+def start_game(agent1, agent2, params, state=None):
+    """Create a new game and prepare both agents, mirroring the setup of GameRunner.run_game.
+    Returns the forward model of the game, which starts from state when given (a pooled map)."""
+    if state is None:
+        game = GameRunner(agent1, agent2, params).forward_model  # The runner generates the map of the game
+    else:
+        game = ForwardModel(state, params)
+    agent1.prepare_to_play_as(Player.Player1, params)
+    agent2.prepare_to_play_as(Player.Player2, params)
+    return game
+
+def pooled_state(maps, index):
+    """The initial state of the index-th game from the map pool, None without a pool"""
+    if maps is None:
+        return None
+    return decode_state(maps[index % len(maps)])
+
+def play_game(agent1, agent2, params, state):
+    """Play one game from the given initial state, mirroring GameRunner.run_game. Returns the forward model."""
+    game = start_game(agent1, agent2, params, state)
+    while not game.is_terminal():
+        p1_action = agent1.get_action(game.state.model_copy(deep=True))
+        p2_action = agent2.get_action(game.state.model_copy(deep=True))
+        game.step({Player.Player1: p1_action, Player.Player2: p2_action})
+    return game
+
+def play_games_lockstep(model, OpponentClass, num_planets, n_games, concurrent_games, maps=None, first_map=0):
+    """Play n_games with up to concurrent_games advancing in lockstep, batching the network inference.
+
+    Every tick the feature matrices of all the live games are stacked into one (K, input_dim) batch
+    and pass through the network together. Finished games drop out of the batch and new games take
+    their place until n_games are played. Returns the number of games won by our agent.
+    With a map pool, game i starts from the map first_map + i of the pool.
+    """
+    wins = 0  # Keep track of the win count
+    started = 0  # Number of the games started so far
+    live = []  # The (game, agent, opponent) of each live game
+    batch = None  # The stacked feature matrices of the live games, reused across ticks
+    while True:
+        stopping = stop_requested()  # No new games once the results are no longer needed
+        if not live and (started >= n_games or stopping):
+            break
+        while len(live) < concurrent_games and started < n_games and not stopping:  # Fill the free slots with new games
+            agent1 = NeuralPlanetWarsAgent(model)  # Agent 1 is our agent
+            agent2 = OpponentClass()  # Agent 2 is the opponent
+            params = GameParams(num_planets=num_planets)
+            live.append((start_game(agent1, agent2, params, pooled_state(maps, first_map + started)), agent1, agent2))
+            started += 1
+
+        states = [game.state for game, _, _ in live]
+        for k, ((_, agent1, _), state) in enumerate(zip(live, states)):
+            M = agent1.features.extract(state, agent1.params, agent1.player)  # Our agent only reads the state
+            if batch is None or batch.shape[1] != M.size:
+                batch = np.zeros((concurrent_games, M.size), dtype=np.float32)
+            batch[k] = M.reshape(-1)
+        noops, logits, ratios = model.forward_batch(batch[:len(live)])  # One forward pass for all the games
+
+        still_live = []
+        for k, ((game, agent1, agent2), state) in enumerate(zip(live, states)):
+            p1_action = agent1.choose_action(state, float(noops[k]), logits[k], float(ratios[k]))
+            p2_action = agent2.get_action(state.model_copy(deep=True))
+            game.step({Player.Player1: p1_action, Player.Player2: p2_action})
+            if not game.is_terminal():
+                still_live.append((game, agent1, agent2))
+            elif game.get_leader() == Player.Player1:  # Update the win count if we won
+                wins += 1
+        live = still_live
+    return wins
+
+def play_population_lockstep(network, OpponentClass, num_planets, n_games, concurrent_games, maps=None):
+    """Play n_games for every candidate of a PopulationNetwork, returns the number of wins of each candidate.
+
+    Every candidate has concurrent_games game slots. Each tick the feature matrices of all the live
+    games are written into one (popsize, concurrent_games, input_dim) batch, which passes through the
+    networks of all the candidates at once. Finished games are replaced until n_games are played.
+    With a map pool, the i-th game of every candidate starts from the same map i of the pool.
+    """
+    P, K = network.popsize, concurrent_games
+    wins = np.zeros((P,), dtype=np.int64)  # The win count of each candidate
+    started = np.zeros((P,), dtype=np.int64)  # Number of the games started by each candidate
+    slots = [[None] * K for _ in range(P)]  # The (game, agent, opponent) of each game slot
+    batch = np.zeros((P, K, network.sizes[0]), dtype=np.float32)
+    while True:
+        live = []  # The (p, k) index of every live game
+        for p in range(P):
+            for k in range(K):
+                if slots[p][k] is None and started[p] < n_games:  # Start a new game in the free slot
+                    agent1 = NeuralPlanetWarsAgent(network)  # Agent 1 is our agent, its network outputs come from the batch
+                    agent2 = OpponentClass()  # Agent 2 is the opponent
+                    state = pooled_state(maps, int(started[p]))
+                    slots[p][k] = (start_game(agent1, agent2, GameParams(num_planets=num_planets), state), agent1, agent2)
+                    started[p] += 1
+                if slots[p][k] is not None:
+                    game, agent1, _ = slots[p][k]
+                    state = game.state  # Our agent only reads the state
+                    batch[p, k] = agent1.features.extract(state, agent1.params, agent1.player).reshape(-1)
+                    live.append((p, k))
+        if not live:
+            break
+        noops, logits, ratios = network.forward_batch(batch)  # One batched forward pass for the whole population
+
+        for p, k in live:
+            game, agent1, agent2 = slots[p][k]
+            state = game.state
+            p1_action = agent1.choose_action(state, float(noops[p, k]), logits[p, k], float(ratios[p, k]))
+            p2_action = agent2.get_action(state.model_copy(deep=True))
+            game.step({Player.Player1: p1_action, Player.Player2: p2_action})
+            if game.is_terminal():
+                if game.get_leader() == Player.Player1:  # Update the win count if we won
+                    wins[p] += 1
+                slots[p][k] = None
+    return wins
+
+def load_class(cls_path):
+    """Import a class given in the module.ClassName format"""
+    mod_name, cls_name = cls_path.rsplit(".", 1)
+    mod = __import__(mod_name, fromlist=[cls_name])
+    return getattr(mod, cls_name)
 
 def evalute_individual(args):
     # Unpack the arguments
-    theta, input_dim, output_dim, num_planets, games_per_eval, opponent_cls_path, hidden_sizes = args
+    theta, input_dim, output_dim, num_planets, games_per_eval, opponent_cls_path, hidden_sizes, concurrent_games, backend = args
     
     # Initialize the Neural Network Model
-    model = NeuralNetwork(input_dim, output_dim, hidden_sizes).eval()
+    model = make_network(input_dim, output_dim, hidden_sizes, backend)
     model.set_model_weights(theta)  # Set the weights of the model to the CMA-ES candidate
     
-    # Import the opponent agent
-    mod_name, cls_name = opponent_cls_path.rsplit(".", 1)  
-    opponent_mod = __import__(mod_name, fromlist=[cls_name])
-    OpponentClass = getattr(opponent_mod, cls_name)
+    OpponentClass = load_class(opponent_cls_path)  # Import the opponent agent
+    return evaluate_model(model, OpponentClass, num_planets, games_per_eval, concurrent_games)
+
+def evaluate_model(model, OpponentClass, num_planets, games_per_eval, concurrent_games, maps=None):
+    """Play games_per_eval games with the model against the opponent and return the negated win ratio"""
+    wins = play_games(model, OpponentClass, num_planets, games_per_eval, concurrent_games, maps)
+    return -(wins / float(games_per_eval))  # Return the ratio of the number of games over the total
+
+def play_games(model, OpponentClass, num_planets, n_games, concurrent_games, maps=None, first_map=0):
+    """Play n_games with the model against the opponent and return the number of wins.
+    With a map pool, game i starts from the map first_map + i of the pool."""
+    if concurrent_games > 1:  # Play the games in lockstep with batched inference
+        return play_games_lockstep(model, OpponentClass, num_planets, n_games, concurrent_games, maps, first_map)
+
     wins = 0  # Keep track of the win count
-    for _ in range(games_per_eval):
+    for i in range(n_games):
+        if stop_requested():
+            break
         agent1 = NeuralPlanetWarsAgent(model)  # Agent 1 is our agent
         agent2 = OpponentClass()  # Agent 2 is the opponent
         params = GameParams(num_planets=num_planets)
-        runner = GameRunner(agent1, agent2, params)
-        game_results = runner.run_game()  # Run the game
+        if maps is None:
+            runner = GameRunner(agent1, agent2, params)
+            game_results = runner.run_game()  # Run the game
+        else:
+            game_results = play_game(agent1, agent2, params, pooled_state(maps, first_map + i))
         if game_results.get_leader() == Player.Player1:  # Update the win count if we won
             wins += 1
-    return -(wins / float(games_per_eval))  # Return the ratio of the number of games over the total
+    return wins
+
+def seed_games(seed):
+    """Seed the random generators used by the game engine and the agents, so that a batch of games can be replayed"""
+    random.seed(int(seed))
+    np.random.seed(int(seed) % 2**32)
+    torch.manual_seed(int(seed))
+
+def play_seeded_games(model, OpponentClass, num_planets, n_games, concurrent_games, seed=None, maps=None, first_map=0):
+    """play_games from a fixed seed, without a seed the games continue from the current random state"""
+    if seed is not None:
+        seed_games(seed)
+    return play_games(model, OpponentClass, num_planets, n_games, concurrent_games, maps, first_map)
+
+class SharedPopulation:
+    """A (popsize, dim) float64 matrix in shared memory that holds the solutions of the current generation"""
+    def __init__(self, popsize, dim):
+        self.shape = (popsize, dim)
+        self.shm = shared_memory.SharedMemory(create=True, size=popsize * dim * np.dtype(np.float64).itemsize)
+        self.matrix = np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def publish(self, solutions):
+        """Copy the solutions of a generation into the shared matrix"""
+        self.matrix[:len(solutions)] = np.asarray(solutions, dtype=np.float64)
+
+    def close(self):
+        del self.matrix  # Release the buffer before closing the shared memory
+        self.shm.close()
+        self.shm.unlink()
+
+# Per-process state of a persistent evaluation worker, filled in by init_worker
+_WORKER = {}
+
+def init_worker(shm_name, shape, input_dim, output_dim, num_planets, games_per_eval, opponent_cls_path, hidden_sizes, concurrent_games, backend, maps_name=None, maps_shape=None, stop_event=None):
+    """Build the model, import the opponent and attach to the shared population (and map pool) once per worker process.
+    Once the stop_event is set, the workers start no new games (see stop_requested)."""
+    torch.set_num_threads(1)  # Every worker evaluates on its own core
+    shm = shared_memory.SharedMemory(name=shm_name)  # The main process owns and unlinks the block
+    _WORKER["shm"] = shm
+    _WORKER["population"] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _WORKER["maps"] = None  # Without a map pool every game generates a new random map
+    if maps_name is not None:
+        maps_shm = shared_memory.SharedMemory(name=maps_name)
+        _WORKER["maps_shm"] = maps_shm
+        _WORKER["maps"] = np.ndarray(maps_shape, dtype=np.float64, buffer=maps_shm.buf)
+    _WORKER["model"] = make_network(input_dim, output_dim, hidden_sizes, backend)
+    _WORKER["network_args"] = (input_dim, output_dim, list(hidden_sizes))
+    _WORKER["opponent"] = load_class(opponent_cls_path)
+    _WORKER["eval_args"] = (num_planets, games_per_eval, concurrent_games)
+    _WORKER["stop"] = stop_event
+
+def stop_requested():
+    """True once the main process no longer needs the results of the running tasks (the end of an async_evolution run)"""
+    stop = _WORKER.get("stop")
+    return stop is not None and stop.is_set()
+
+def evaluate_population_row(idx):
+    """Evaluate the individual in row idx of the shared population inside a persistent worker"""
+    model = _WORKER["model"]
+    model.set_model_weights(_WORKER["population"][idx])  # Set the weights of the model to the CMA-ES candidate
+    return evaluate_model(model, _WORKER["opponent"], *_WORKER["eval_args"], _WORKER["maps"])
+
+def play_population_games(task):
+    """Play n_games from map first_map on with the individual in row idx of the shared population, returns (idx, wins, n_games)"""
+    idx, n_games, first_map = task
+    num_planets, _, concurrent_games = _WORKER["eval_args"]
+    model = _WORKER["model"]
+    model.set_model_weights(_WORKER["population"][idx])  # Set the weights of the model to the CMA-ES candidate
+    return idx, play_games(model, _WORKER["opponent"], num_planets, n_games, concurrent_games, _WORKER["maps"], first_map), n_games
+
+def play_seeded_population_games(task):
+    """Play the (idx, first_game, n_games, seed) task of game_tasks with the individual in row idx of the shared population,
+    returns (idx, wins). With a map pool, the games start from the maps first_game to first_game + n_games - 1."""
+    idx, first_game, n_games, seed = task
+    num_planets, _, concurrent_games = _WORKER["eval_args"]
+    model = _WORKER["model"]
+    model.set_model_weights(_WORKER["population"][idx])  # Set the weights of the model to the CMA-ES candidate
+    return idx, play_seeded_games(model, _WORKER["opponent"], num_planets, n_games, concurrent_games, seed, _WORKER["maps"], first_game)
+
+def init_theta_worker(input_dim, output_dim, num_planets, opponent_cls_path, hidden_sizes, concurrent_games, backend):
+    """Build the model and import the opponent once per process of an eval_broker.py worker"""
+    torch.set_num_threads(1)  # Every worker evaluates on its own core
+    _WORKER["model"] = make_network(input_dim, output_dim, hidden_sizes, backend)
+    _WORKER["opponent"] = load_class(opponent_cls_path)
+    _WORKER["eval_args"] = (num_planets, None, concurrent_games)
+
+def play_theta_games(task):
+    """Play the (task_id, theta, n_games, seed) task of the broker coordinator, returns (task_id, wins)"""
+    task_id, theta, n_games, seed = task
+    num_planets, _, concurrent_games = _WORKER["eval_args"]
+    model = _WORKER["model"]
+    model.set_model_weights(theta)  # Set the weights of the model to the CMA-ES candidate
+    return task_id, play_seeded_games(model, _WORKER["opponent"], num_planets, n_games, concurrent_games, seed)
 
-def train():
+TASKS_PER_WORKER = 8  # Tasks of every worker per generation with game_scheduling, more tasks shorten the tail but cost more messages
+
+def task_games(popsize, workers):
+    """Games per task of game_tasks: eval_task_games, or with game_scheduling (and no eval_seed) about TASKS_PER_WORKER
+    tasks per worker, with at least concurrent_games games so that the lockstep batches stay full"""
+    if EVAL_TASK_GAMES > 0:
+        return min(EVAL_TASK_GAMES, GAMES_PER_EVAL)
+    if not GAME_SCHEDULING or EVAL_SEED is not None:  # The seeds depend on the tasks, so they never depend on the worker count
+        return GAMES_PER_EVAL
+    per_task = -(-popsize * GAMES_PER_EVAL // (max(1, workers) * TASKS_PER_WORKER))
+    return min(GAMES_PER_EVAL, max(CONCURRENT_GAMES, per_task))
+
+def game_tasks(gen, popsize, per_task):
+    """Split the games of a generation into (idx, first_game, n_games, seed) tasks of at most per_task games.
+    The seeds only depend on eval_seed, the generation, the individual and the task, so the games are the
+    same wherever they are played. Without eval_seed the seeds are None and the games are not reproducible.
+    The tasks are sorted longest first, so the short remainder tasks fill the idle workers at the end of the generation."""
+    tasks = []
+    for idx in range(popsize):
+        for batch, first in enumerate(range(0, GAMES_PER_EVAL, per_task)):
+            seed = None
+            if EVAL_SEED is not None:
+                seed = int(np.random.SeedSequence([EVAL_SEED, gen, idx, batch]).generate_state(1)[0])
+            tasks.append((idx, first, min(per_task, GAMES_PER_EVAL - first), seed))
+    tasks.sort(key=lambda task: -task[2])  # Stable, the tasks of the same length stay in individual order
+    return tasks
+
+def task_losses(popsize, tasks, wins):
+    """Sum the wins of the game_tasks of every individual into its negated win ratio"""
+    totals = [0] * popsize
+    for (idx, _, _, _), w in zip(tasks, wins):
+        totals[idx] += int(w)
+    return [-(w / float(GAMES_PER_EVAL)) for w in totals]
+
+def evaluate_population_slice(rows):
+    """Evaluate the individuals in rows [start, stop) of the shared population with one batched network"""
+    start, stop = rows
+    num_planets, games_per_eval, concurrent_games = _WORKER["eval_args"]
+    networks = _WORKER.setdefault("population_networks", {})
+    network = networks.get(stop - start)
+    if network is None:
+        input_dim, output_dim, hidden_sizes = _WORKER["network_args"]
+        network = networks[stop - start] = PopulationNetwork(input_dim, output_dim, hidden_sizes, stop - start)
+    network.set_population_weights(_WORKER["population"][start:stop])
+    wins = play_population_lockstep(network, _WORKER["opponent"], num_planets, games_per_eval, concurrent_games, _WORKER["maps"])
+    return [-(w / float(games_per_eval)) for w in wins]
+
+def profile_hot_paths(OpponentClass=None):
+    """Time the phases of the games played in this process, see profiler.py"""
+    profile_agent()
+    instrument(PopulationNetwork, "forward_batch", "inference")
+    instrument(ForwardModel, "step", "forward_model")
+    instrument(GameState, "model_copy", "state_copy")
+    instrument(sys.modules[__name__], "start_game", "new_game")  # Includes the generation of the map
+    if OpponentClass is not None:
+        instrument(OpponentClass, "get_action", "opponent")
+
+def run_timed(task):
+    """Run fn(arg) in a pool worker, returns its result and the seconds it took"""
+    fn, arg = task
+    start = time.perf_counter()
+    result = fn(arg)
+    return result, time.perf_counter() - start
+
+def run_profiled(task):
+    """Run fn(arg) in a pool worker with the hot paths timed, returns its result and the profile of the worker since its last task"""
+    fn, arg, opponent_cls_path = task
+    if "profiled" not in _WORKER:
+        profile_hot_paths(load_class(opponent_cls_path))
+        _WORKER["profiled"] = True
+    start = time.time()
+    result = fn(arg)
+    PROFILE.add_span(fn.__name__, start, time.time())
+    return result, PROFILE.take()
+
+def pool_submit(executor, fn, task):
+    """executor.submit(fn, task), timed in the worker (and profiled with --profile), see pool_result"""
+    if PROFILING:
+        return executor.submit(run_profiled, (fn, task, OPPONENT))
+    return executor.submit(run_timed, (fn, task))
+
+def pool_result(future):
+    """The result of a pool_submit task. Its busy seconds are added to the busy phase of PROFILE,
+    and with --profile the phase timers and task spans of the worker are merged into PROFILE."""
+    result, timing = future.result()
+    if PROFILING:
+        _, _, start, end = timing["spans"][-1]
+        PROFILE.add("busy", end - start)
+        PROFILE.merge(timing)
+    else:
+        PROFILE.add("busy", timing)
+    return result
+
+def pool_map(executor, fn, tasks):
+    """list(executor.map(fn, tasks)) with the tasks timed like pool_submit"""
+    submitted = [pool_submit(executor, fn, task) for task in tasks]
+    return [pool_result(future) for future in submitted]
+
+def take_busy():
+    """The busy seconds of the pool workers since the last call, see pool_map"""
+    PROFILE.calls.pop("busy", None)
+    return PROFILE.seconds.pop("busy", 0.0)
+
+def profile_generation(writer, trace, gen, main_spans, pool_size):
+    """Merge the profile of a generation with the (label, start, end) spans of the main process, print it and save it"""
+    for label, start, end in main_spans:
+        PROFILE.add(label, end - start)
+        PROFILE.add_span(label, start, end)
+    data = PROFILE.take()
+    _, eval_start, eval_end = next(span for span in main_spans if span[0] == "evaluate")
+    main_pid = os.getpid()
+    workers = worker_stats([span for span in data["spans"] if span[0] != main_pid], eval_end - eval_start)
+    busy = sum(b for _, b, _ in workers.values())
+    utilization = busy / ((eval_end - eval_start) * pool_size) if workers else 0.0  # Remote broker workers are not profiled
+    print(f"PROFILE {gen+1}/{GENS}	Worker Time = {busy:.2f}s ({utilization*100:.0f}% of {pool_size} workers)	{format_phases(data)}")
+    writer.write_profile(gen, {phase: (seconds, data["calls"][phase]) for phase, seconds in data["seconds"].items()}, workers)
+    trace.write_spans(data["spans"], {"generation": gen + 1})
+    trace.write_counters("phase seconds", data["seconds"], eval_end)
+
+def trace_path(db_path, start_gen):
+    """Trace file of a run, a resumed run starts a new one"""
+    base = os.path.splitext(db_path)[0]
+    return f"{base}.trace.json" if start_gen == 0 else f"{base}.from{start_gen + 1}.trace.json"
+
+def population_slices(popsize, n_slices):
+    """Split the rows of the population into n_slices contiguous [start, stop) slices"""
+    bounds = np.linspace(0, popsize, min(n_slices, popsize) + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])]
+
+def publish_maps(map_pool, writer, gen):
+    """Draw the map pool of a generation (the pool of the run with map_pool_refresh: run) and share it with the workers"""
+    map_gen = gen if MAP_POOL_REFRESH == "generation" else 0  # The seeds only depend on the run seed and the generation
+    seeds = map_seeds(MAP_POOL_SEED, map_gen, MAP_POOL_SIZE)
+    map_pool.publish(generate_maps(GameParams(num_planets=NUM_PLANETS), seeds))
+    if map_gen == gen:  # A resumed run keeps the seeds recorded by the first generation
+        writer.write_maps(gen, seeds)
+
+def evolve_async(es, executor, population, writer, trace, start_gen, ckpt_path, deadline, pool_size, stop_event):
+    """Steady-state CMA-ES without a barrier between the generations. Every row of the shared population holds a
+    candidate in evaluation, a finished row gets the next candidate right away, and the CMA-ES is told as soon as
+    popsize new evaluations have arrived, while the workers keep playing. The candidates that were sampled before
+    the latest update (an older version of the distribution) have their steps clipped by tell.
+    At the end the queued candidates are dropped, and the stop_event makes the running evaluations
+    return after their current games. Returns the games won and played."""
+    free_rows = list(range(population.shape[0]))
+    running = {}  # future -> (row, solution, version)
+    asked = []  # Candidates sampled from the current distribution and not submitted yet
+    finished = []  # (solution, loss, version) of the evaluations not told yet
+    won = played = 0
+    gen = start_gen
+    eval_start = time.perf_counter()
+    eval_wall_start = time.time()
+    try:
+        while gen < GENS:
+            while free_rows:
+                if not asked:
+                    asked = [(sol, es.countiter) for sol in es.ask()]
+                solution, version = asked.pop()
+                row = free_rows.pop()
+                population.matrix[row] = solution  # No worker reads a free row
+                running[pool_submit(executor, evaluate_population_row, row)] = (row, solution, version)
+            done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                row, solution, version = running.pop(future)
+                finished.append((solution, pool_result(future), version))
+                free_rows.append(row)
+            if len(finished) < es.popsize:
+                continue
+
+            batch, finished = finished[:es.popsize], finished[es.popsize:]
+            solutions, losses_list, versions = (list(column) for column in zip(*batch))
+            eval_time = time.perf_counter() - eval_start  # Time since the previous update
+            # A task that finished in this interval may have started in the previous one, hence the cap
+            utilization = min(1.0, take_busy() / (eval_time * pool_size))
+            record_start = time.time()
+            won += record_generation(es, writer, gen, solutions, losses_list, [GAMES_PER_EVAL] * len(batch), eval_time, utilization, versions)
+            played += GAMES_PER_EVAL * len(batch)
+            asked = []  # The next candidates come from the updated distribution
+            if PROFILING:
+                main_spans = [("evaluate", eval_wall_start, record_start), ("tell", record_start, time.time())]
+                profile_generation(writer, trace, gen, main_spans, pool_size)
+            eval_start = time.perf_counter()
+            eval_wall_start = time.time()
+            out_of_time = deadline is not None and time.time() >= deadline
+            if (gen + 1) % CHECKPOINT_EVERY == 0 or gen + 1 == GENS or out_of_time:
+                data = make_checkpoint(es, gen, cfg)
+                writer.after_writes(lambda data=data: save_checkpoint(ckpt_path, data))
+            gen += 1
+            if out_of_time:
+                break
+    finally:
+        stop_event.set()  # The results of the running evaluations are not used, a resumed run samples new candidates
+        for future in running:
+            future.cancel()
+    return won, played
+
+def race_generation(executor, es, popsize):
+    """Evaluate the shared population with a racing schedule, returns the losses and games played of each individual"""
+    race = Race(popsize, es.sp.weights.mu, RACING_CONFIDENCE, RACING_MIN_GAMES, RACING_MAX_GAMES, RACING_TOLERANCE)
+    while True:
+        # Every individual continues on the maps after the ones it already played
+        tasks = [(idx, n_games, int(race.games[idx])) for idx, n_games in race.next_round(RACING_ROUND_GAMES)]
+        if not tasks:
+            break
+        for idx, wins, n_games in pool_map(executor, play_population_games, tasks):
+            race.record(idx, wins, n_games)
+        if race.update():
+            break
+    return [-float(f) for f in race.fitness()], [int(g) for g in race.games]
+
+def screen_generation(executor, es, gen, solutions, surrogate, pool_size):
+    """Multi-fidelity evaluation of the shared population. Every candidate plays screening_games games, and the
+    best screening_keep of them (at least the mu parents), ranked by the estimate of their full win ratio, play
+    the rest of the budget. The others keep their estimate, which also uses the surrogate predictions once the
+    surrogate has seen a generation. Returns the losses, games played and fidelity of each individual."""
+    popsize = len(solutions)
+    wins = np.zeros((popsize,), dtype=np.int64)
+    games = np.zeros((popsize,), dtype=np.int64)
+    if SCREENING_GAMES > 0:
+        for idx, w in pool_map(executor, play_seeded_population_games, [(idx, 0, SCREENING_GAMES, None) for idx in range(popsize)]):
+            wins[idx] += w
+            games[idx] += SCREENING_GAMES
+    predicted = surrogate.predict(solutions, popsize) if surrogate is not None else None
+    estimates = estimate_win_ratios(wins, games, predicted)
+    if np.isnan(estimates).any():  # Surrogate only and not trained yet, every candidate is evaluated
+        promoted = np.arange(popsize)
+    else:
+        keep = min(popsize, max(int(es.sp.weights.mu), int(np.ceil(SCREENING_KEEP * popsize))))
+        promoted = np.argsort(-estimates, kind="stable")[:keep]
+
+    # The promoted candidates continue on the maps after their screening games
+    remaining = GAMES_PER_EVAL - SCREENING_GAMES
+    per_task = min(remaining, task_games(len(promoted), pool_size))
+    tasks = [(int(idx), first, min(per_task, GAMES_PER_EVAL - first), None) for idx in promoted for first in range(SCREENING_GAMES, GAMES_PER_EVAL, per_task)]
+    tasks.sort(key=lambda task: -task[2])
+    for idx, w in pool_map(executor, play_seeded_population_games, tasks):
+        wins[idx] += w
+    games[promoted] = GAMES_PER_EVAL
+
+    fitness = estimates.copy()
+    fitness[promoted] = wins[promoted] / float(GAMES_PER_EVAL)
+    fidelities = [FIDELITY_SCREENING if SCREENING_GAMES > 0 else FIDELITY_SURROGATE] * popsize
+    for idx in promoted:
+        fidelities[idx] = FIDELITY_FULL
+    if len(promoted) < popsize:  # How far the estimates of the promoted candidates were from their full win ratio
+        error = float(np.mean(np.abs(estimates[promoted] - fitness[promoted])))
+        surrogate_error = float(np.mean(np.abs(predicted[promoted] - fitness[promoted]))) if predicted is not None else None
+        print(f"SCREEN {gen+1}/{GENS}\tPromoted = {len(promoted)}/{popsize}\t\tEstimate Error = {error*100:.2f}%"
+              + (f"\t\tSurrogate Error = {surrogate_error*100:.2f}%" if surrogate_error is not None else ""))
+    if surrogate is not None:
+        surrogate.add([solutions[idx] for idx in promoted], fitness[promoted])
+    return [-float(f) for f in fitness], [int(g) for g in games], fidelities
+
+def train(resume=None):
     input_dim = NUM_PLANETS * NUM_FEATURES  # Input dimensions for the network
     output_dim = NUM_PLANETS + 2  # We have 1 logit for the noop, 1 for each planet and 1 for ratio
-    model = NeuralNetwork(input_dim, output_dim, HIDDEN_SIZES)  # The neural network model as the initial model
-    theta0 = model.get_model_weights()  # Get the initial theta (which is random)
 
-    es = cma.CMAEvolutionStrategy(theta0, SIGMA0)  # Start the CMA-ES
-    
-    # Prepare data directory and sqlite database
-    data_dir = os.path.join(os.path.dirname(__file__), "data")
-    os.makedirs(data_dir, exist_ok=True)
-    db_path = os.path.join(data_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.sqlite3")
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("CREATE TABLE IF NOT EXISTS config (k TEXT PRIMARY KEY, v TEXT)")
-    cur.execute("CREATE TABLE IF NOT EXISTS results (generation INTEGER, individual INTEGER, fitness REAL, solution BLOB)")
-    for k, v in cfg.items():
-        cur.execute("INSERT OR REPLACE INTO config (k, v) VALUES (?, ?)", (str(k), str(v)))
-    conn.commit()
-    
-    for gen in range(GENS):  # For each generation
-        solutions = es.ask()  # Ask CMA-ES for solutions
-        
-        # For each solution, generate a task with the parameters
-        tasks = [(np.asarray(sol, dtype=np.float64), input_dim, output_dim, NUM_PLANETS, GAMES_PER_EVAL, OPPONENT, list(HIDDEN_SIZES)) for sol in solutions]
-        popsize = len(solutions)  # Number of individuals in the population
-        
-        cores = os.cpu_count() or 1
-        capacity = WORKERS_PER_CORE * cores
-        max_workers = popsize if popsize <= capacity else capacity
-        
-        with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-            losses_list = list(executor.map(evalute_individual, tasks))
-        losses = [float(x) for x in losses_list]  # Get the losses
-        es.tell(solutions, losses)  # Update the CMA-ES
-        wins = [-l for l in losses]  # Get the real win ratios and other metrics
-        gen_best = float(np.max(wins))
-        gen_avg = float(np.mean(wins))
-        print(f"GEN {gen+1}/{GENS}\tBest Win Ratio = {gen_best*100:.2f}%\t\tAverage Win Ratio = {gen_avg*100:.2f}%")
-        
-        # Save per-individual results
-        for idx, sol in enumerate(solutions):
-            fitness = float(wins[idx])
-            solution_blob = np.asarray(sol, dtype=np.float64).tobytes()
-            cur.execute(
-                "INSERT INTO results (generation, individual, fitness, solution) VALUES (?, ?, ?, ?)",
-                (int(gen), int(idx), fitness, sqlite3.Binary(solution_blob))
-            )
-        conn.commit()
+    if resume is not None:  # Continue the run of the database from its last checkpoint
+        db_path, ckpt = resume
+        es = ckpt["es"]
+        start_gen = ckpt["generation"] + 1
+        writer = ResultsWriter(db_path, codec=SolutionCodec(SOLUTION_CODEC), profile=PROFILING)
+        writer.discard_from(start_gen)  # Drop the generations that were saved after the checkpoint
+        print(f"Resuming {db_path} from generation {start_gen + 1}")
+    else:
+        cma_options = {}
+        if EVAL_SEED is not None:  # The initial weights and the samples of the CMA-ES are also reproducible
+            seed_games(EVAL_SEED)
+            cma_options["seed"] = EVAL_SEED % (2**31 - 1) + 1  # pycma draws a random seed for 0
+        model = NeuralNetwork(input_dim, output_dim, HIDDEN_SIZES)  # The neural network model as the initial model
+        theta0 = model.get_model_weights()  # Get the initial theta (which is random)
+        es = cma.CMAEvolutionStrategy(theta0, SIGMA0, cma_options)  # Start the CMA-ES
+        start_gen = 0
+
+        # Prepare data directory and sqlite database
+        data_dir = os.path.join(os.path.dirname(__file__), "data")
+        os.makedirs(data_dir, exist_ok=True)
+        db_path = os.path.join(data_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.sqlite3")
+        writer = ResultsWriter(db_path, cfg, codec=SolutionCodec(SOLUTION_CODEC), profile=PROFILING)  # Writes the results in the background while the next generation plays
+    ckpt_path = checkpoint_path(db_path)
+    trace = TraceWriter(trace_path(db_path, start_gen)) if PROFILING else None
+
+    popsize = es.popsize  # Number of individuals in the population
+    cores = os.cpu_count() or 1
+    capacity = WORKERS_PER_CORE * cores
+    max_workers = popsize if popsize <= capacity else capacity
 
+    # One long-lived pool for the whole run. The workers are warmed up once and read the
+    # solutions of each generation from a shared matrix, so a task is just a row index.
+    population = None
+    executor = None
+    map_pool = None
+    broker = None
+    if BROKER:
+        # The games are played by the eval_broker.py workers that connect to this coordinator
+        setup = {"input_dim": input_dim, "output_dim": output_dim, "num_planets": NUM_PLANETS, "opponent": OPPONENT,
+                 "hidden_sizes": list(HIDDEN_SIZES), "concurrent_games": CONCURRENT_GAMES, "backend": BACKEND}
+        broker = EvaluationBroker(setup, BROKER_HOST, BROKER_PORT, BROKER_TOKEN)
+        print(f"Evaluation broker listening on {BROKER_HOST}:{broker.address[1]}")
+    elif PERSISTENT_POOL:
+        # In the asynchronous mode a row holds the candidate of one worker instead of an individual of the generation
+        population = SharedPopulation(max_workers if ASYNC_EVOLUTION else popsize, es.N)
+        stop_event = multiprocessing.Event() if ASYNC_EVOLUTION else None
+        # All the candidates of a generation play on the same pooled maps (common random numbers)
+        map_pool = MapPool(MAP_POOL_SIZE, NUM_PLANETS) if MAP_POOL_SIZE > 0 else None
+        executor = futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=init_worker,
+            initargs=(population.name, population.shape, input_dim, output_dim, NUM_PLANETS, GAMES_PER_EVAL, OPPONENT, list(HIDDEN_SIZES), CONCURRENT_GAMES, BACKEND,
+                      map_pool.name if map_pool is not None else None, map_pool.shape if map_pool is not None else None, stop_event),
+        )
+
+    # Predicts the win ratios of the candidates from the fully evaluated ones, it starts over on resume
+    surrogate = Surrogate(SURROGATE_ROWS) if SURROGATE_ROWS > 0 else None
+    run_start = time.time()
+    deadline = run_start + TIME_BUDGET_HOURS * 3600 if TIME_BUDGET_HOURS is not None else None
+    won = played = 0  # Games won and played by the candidates of this session
+    try:
+        if ASYNC_EVOLUTION:
+            if map_pool is not None:
+                publish_maps(map_pool, writer, start_gen)
+            won, played = evolve_async(es, executor, population, writer, trace, start_gen, ckpt_path, deadline, max_workers, stop_event)
+        else:
+            for gen in range(start_gen, GENS):  # For each generation
+                gen_start = time.time()
+                solutions = es.ask()  # Ask CMA-ES for solutions
+                eval_start = time.perf_counter()
+                eval_wall_start = time.time()
+
+                if map_pool is not None and (gen == start_gen or MAP_POOL_REFRESH == "generation"):
+                    publish_maps(map_pool, writer, gen)
+
+                games_list = [GAMES_PER_EVAL] * len(solutions)  # Number of games played by each individual
+                fidelities = None
+                if RACING:
+                    population.publish(solutions)
+                    losses_list, games_list = race_generation(executor, es, len(solutions))
+                elif POPULATION_BATCH:
+                    # One task per core, each evaluates a slice of the population with a single batched network
+                    population.publish(solutions)
+                    losses_list = []
+                    for slice_losses in pool_map(executor, evaluate_population_slice, population_slices(len(solutions), cores)):
+                        losses_list.extend(slice_losses)
+                elif SCREENING:
+                    population.publish(solutions)
+                    losses_list, games_list, fidelities = screen_generation(executor, es, gen, solutions, surrogate, max_workers)
+                elif BROKER:
+                    tasks = game_tasks(gen, len(solutions), task_games(len(solutions), broker.slots()))
+                    wins = broker.map([(np.asarray(solutions[idx], dtype=np.float64), n_games, seed) for idx, _, n_games, seed in tasks])
+                    losses_list = task_losses(len(solutions), tasks, wins)
+                elif PERSISTENT_POOL and (GAME_SCHEDULING or EVAL_SEED is not None):
+                    # Small tasks of games, the longest first. The idle workers take the next task from the shared
+                    # queue of the pool, so they all finish the generation at about the same time. These are also
+                    # the seeded tasks of the broker, so that a single-node run reproduces a multi-node one.
+                    population.publish(solutions)
+                    tasks = game_tasks(gen, len(solutions), task_games(len(solutions), max_workers))
+                    wins = [w for _, w in pool_map(executor, play_seeded_population_games, tasks)]
+                    losses_list = task_losses(len(solutions), tasks, wins)
+                elif PERSISTENT_POOL:
+                    population.publish(solutions)
+                    losses_list = pool_map(executor, evaluate_population_row, range(len(solutions)))
+                else:
+                    # For each solution, generate a task with the parameters
+                    tasks = [(np.asarray(sol, dtype=np.float64), input_dim, output_dim, NUM_PLANETS, GAMES_PER_EVAL, OPPONENT, list(HIDDEN_SIZES), CONCURRENT_GAMES, BACKEND) for sol in solutions]
+                    with futures.ProcessPoolExecutor(max_workers=max_workers) as gen_executor:
+                        losses_list = pool_map(gen_executor, evalute_individual, tasks)
+                eval_time = time.perf_counter() - eval_start
+                busy = take_busy()  # Not measured for the broker workers
+                utilization = busy / (eval_time * max_workers) if busy > 0 else None
+                record_start = time.time()
+                won += record_generation(es, writer, gen, solutions, losses_list, games_list, eval_time, utilization, fidelities=fidelities)
+                played += sum(games_list)
+                if PROFILING:
+                    main_spans = [("ask", gen_start, eval_wall_start), ("evaluate", eval_wall_start, eval_wall_start + eval_time), ("tell", record_start, time.time())]
+                    profile_generation(writer, trace, gen, main_spans, max_workers)
+                out_of_time = deadline is not None and time.time() >= deadline
+                if (gen + 1) % CHECKPOINT_EVERY == 0 or gen + 1 == GENS or out_of_time:
+                    # Snapshot the state now, write it once the results up to this generation are committed
+                    data = make_checkpoint(es, gen, cfg)
+                    writer.after_writes(lambda data=data: save_checkpoint(ckpt_path, data))
+                if out_of_time:
+                    break
+    finally:
+        if broker is not None:
+            broker.close()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)  # Drop the queued tasks, e.g. after an error or with async_evolution
+        if population is not None:
+            population.close()
+        if map_pool is not None:
+            map_pool.close()
+        if trace is not None:
+            trace.close()
+        writer.close(raise_error=sys.exc_info()[0] is None)  # Do not hide the exception of the training loop
+
+    hours = (time.time() - run_start) / 3600
+    if played > 0 and not BROKER:  # Compares the modes on the same budget, the cores of broker workers are not known here
+        core_hours = hours * min(cores, max_workers)
+        print(f"Won {won:.0f} of {played} games in {hours:.2f}h on {min(cores, max_workers)} cores ({won / core_hours:.0f} wins per core-hour)")
+
+    cat = open_catalog(catalog_path(os.path.dirname(db_path)))  # Add the elites of the finished run to the catalog
+    try:
+        update_catalog(cat, [db_path])
+    finally:
+        cat.close()
     print("Training Completed!")
-    conn.close()
+
+def record_generation(es, writer, gen, solutions, losses_list, games_list, eval_time, utilization=None, versions=None, fidelities=None):
+    """Update the CMA-ES with the losses of a generation, report it and save the individuals, returns the games won.
+    The utilization is the share of the evaluation time the pool workers were busy playing games, the versions
+    are the CMA-ES iterations the solutions were sampled at (all the current one in the synchronous mode), and
+    the fidelities tell how the losses of a screened generation were measured (screening.py)."""
+    if versions is None:
+        versions = [es.countiter] * len(solutions)
+    stale = [i for i, v in enumerate(versions) if v < es.countiter]  # Sampled before the latest update
+    losses = [float(x) for x in losses_list]  # Get the losses
+    es.tell(solutions, losses, check_points=stale or None)  # Update the CMA-ES, clipping the long steps of the stale solutions
+    wins = [-l for l in losses]  # Get the real win ratios and other metrics
+    gen_best = float(np.max(wins))
+    gen_avg = float(np.mean(wins))
+    print(f"GEN {gen+1}/{GENS}\tBest Win Ratio = {gen_best*100:.2f}%\t\tAverage Win Ratio = {gen_avg*100:.2f}%\t\tGames = {sum(games_list)}\t\tEval Time = {eval_time:.2f}s ({sum(games_list) / eval_time:.1f} games/s)"
+          + (f"\t\tUtilization = {utilization*100:.0f}%" if utilization is not None else "")
+          + (f"\t\tStale = {len(stale)}" if stale else ""))
+
+    writer.write_generation(gen, solutions, wins, games_list, eval_time, versions, fidelities)  # Save per-individual results and the generation summary
+    return sum(w * g for w, g in zip(wins, games_list))  # The screened-out candidates count with their estimated win ratio
 
 if __name__ == "__main__":
-    cfg = load_config()
+    cfg, resume, PROFILING = load_config()
     
     NUM_PLANETS = int(cfg["num_planets"])
     NUM_FEATURES = int(cfg["num_features"])
@@ -261,5 +741,73 @@ if __name__ == "__main__":
     SIGMA0 = float(cfg["sigma0"])
     OPPONENT = str(cfg["opponent"])
     WORKERS_PER_CORE = int(cfg["workers_per_core"])
+    CONCURRENT_GAMES = int(cfg.get("concurrent_games", 1))  # Games played in lockstep per individual
+    PERSISTENT_POOL = bool(cfg.get("persistent_pool", True))  # Keep one warm worker pool for the whole run
+    BACKEND = str(cfg.get("inference_backend", "torch"))  # Inference backend of the evaluation networks
+    RACING = bool(cfg.get("racing", False))  # Stop playing games once an individual's rank is settled
+    RACING_CONFIDENCE = float(cfg.get("racing_confidence", 0.95))
+    RACING_MIN_GAMES = int(cfg.get("racing_min_games", 10))
+    RACING_MAX_GAMES = int(cfg.get("racing_max_games", GAMES_PER_EVAL))
+    RACING_ROUND_GAMES = int(cfg.get("racing_round_games", RACING_MIN_GAMES))
+    RACING_TOLERANCE = float(cfg.get("racing_tolerance", 0.1))
+    POPULATION_BATCH = bool(cfg.get("population_batch", False))  # Batch the inference of the whole population
+    CHECKPOINT_EVERY = int(cfg.get("checkpoint_every", 10))  # Generations between two checkpoints of the CMA-ES state
+    MAP_POOL_SIZE = int(cfg.get("map_pool_size", 0))  # Maps shared by all the candidates, 0 generates a new map for every game
+    MAP_POOL_REFRESH = str(cfg.get("map_pool_refresh", "generation"))  # Draw a new pool every "generation" or once per "run"
+    if cfg.get("map_pool_seed") is None:
+        cfg["map_pool_seed"] = int(np.random.SeedSequence().entropy % (2**31))  # Saved with the config so the maps can be regenerated
+    MAP_POOL_SEED = int(cfg["map_pool_seed"])
+    if resume is not None:  # results_db.py --codec may have rewritten the run since its checkpoint, its config table has the codec
+        conn = connect_readonly(resume[0])
+        try:
+            stored = read_config(conn)
+        finally:
+            conn.close()
+        cfg["solution_codec"] = stored.get("solution_codec", "float64")
+        cfg["solution_codec_version"] = int(stored.get("solution_codec_version", CODEC_VERSION))
+    cfg.setdefault("solution_codec", "float64")  # Storage codec of the solution BLOBs, saved with the config for the readers
+    cfg.setdefault("solution_codec_version", CODEC_VERSION)
+    SOLUTION_CODEC = str(cfg["solution_codec"])
+    BROKER = bool(cfg.get("broker", False))  # Play the games on the eval_broker.py workers instead of a local pool
+    BROKER_HOST = str(cfg.get("broker_host", "127.0.0.1"))  # Only local workers unless it is set to an address of another interface
+    BROKER_PORT = int(cfg.get("broker_port", 5555))
+    BROKER_TOKEN = os.environ.get("BROKER_TOKEN", "")  # Workers must present the same token, it is never saved with the run
+    if cfg.pop("broker_token", None) is not None and resume is None:
+        raise SystemExit("broker_token would be saved in the run database and checkpoints, set the BROKER_TOKEN environment variable instead")
+    GAME_SCHEDULING = bool(cfg.get("game_scheduling", False))  # Split the evaluation of every individual into small tasks of games
+    EVAL_TASK_GAMES = int(cfg.get("eval_task_games", 0))  # Games per task, 0 sizes them from the worker count with game_scheduling, else all the games of an individual
+    EVAL_SEED = None if cfg.get("eval_seed") is None else int(cfg["eval_seed"])  # Seeds the initial weights, the CMA-ES and the games, so that runs can be reproduced
+    ASYNC_EVOLUTION = bool(cfg.get("async_evolution", False))  # Update the CMA-ES as the evaluations arrive, without a generation barrier
+    SCREENING_GAMES = int(cfg.get("screening_games", 0))  # Games played by every candidate before the full evaluation, 0 disables the screening
+    SCREENING_KEEP = float(cfg.get("screening_keep", 0.5))  # Share of the population that gets the full game budget
+    SURROGATE_ROWS = int(cfg.get("screening_surrogate_rows", 0))  # Fully evaluated candidates the surrogate learns from, 0 disables it
+    SCREENING = SCREENING_GAMES > 0 or SURROGATE_ROWS > 0
+    TIME_BUDGET_HOURS = None if cfg.get("time_budget_hours") is None else float(cfg["time_budget_hours"])  # Stop after this wall-clock time
+    if (RACING or POPULATION_BATCH or MAP_POOL_SIZE > 0) and not PERSISTENT_POOL:
+        raise SystemExit("racing, population_batch and map_pool_size require persistent_pool: true")
+    if MAP_POOL_REFRESH not in ("generation", "run"):
+        raise SystemExit("map_pool_refresh must be generation or run")
+    try:
+        SolutionCodec(SOLUTION_CODEC)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if RACING and POPULATION_BATCH:
+        raise SystemExit("racing and population_batch can not be used together")
+    if BROKER and not BROKER_TOKEN and not is_loopback(BROKER_HOST):
+        raise SystemExit(f"broker_host {BROKER_HOST} accepts other machines, set the BROKER_TOKEN environment variable")
+    if BROKER and (RACING or POPULATION_BATCH or MAP_POOL_SIZE > 0):
+        raise SystemExit("broker can not be used with racing, population_batch or map_pool_size")
+    if EVAL_SEED is not None and not BROKER and (RACING or POPULATION_BATCH or not PERSISTENT_POOL):
+        raise SystemExit("eval_seed requires broker: true, or persistent_pool: true without racing and population_batch")
+    if GAME_SCHEDULING and not BROKER and (RACING or POPULATION_BATCH or not PERSISTENT_POOL):
+        raise SystemExit("game_scheduling requires broker: true, or persistent_pool: true without racing and population_batch")
+    if ASYNC_EVOLUTION and (BROKER or RACING or POPULATION_BATCH or GAME_SCHEDULING or EVAL_SEED is not None or not PERSISTENT_POOL):
+        raise SystemExit("async_evolution requires persistent_pool: true without broker, racing, population_batch, game_scheduling and eval_seed")
+    if SCREENING and (BROKER or RACING or POPULATION_BATCH or ASYNC_EVOLUTION or EVAL_SEED is not None or not PERSISTENT_POOL):
+        raise SystemExit("screening_games and screening_surrogate_rows require persistent_pool: true without broker, racing, population_batch, async_evolution and eval_seed")
+    if SCREENING and not (0 <= SCREENING_GAMES < GAMES_PER_EVAL and 0.0 < SCREENING_KEEP <= 1.0):
+        raise SystemExit("screening_games must be below games_per_eval and screening_keep in (0, 1]")
+    if ASYNC_EVOLUTION and MAP_POOL_SIZE > 0 and MAP_POOL_REFRESH != "run":
+        raise SystemExit("async_evolution requires map_pool_refresh: run, the candidates of different generations play at the same time")
 
-    train()
+    train(resume)
@@ -0,0 +1,145 @@
+"""Memory-mappable weight files of trained agents (.pwnn).
+
+A file is a fixed prefix (magic, format version, header length), a JSON header with the network
+shape, the dtype and the offset and shape of every layer array, and the raw arrays, each aligned
+to ALIGN bytes. The weight matrices are stored as (in, out), the layout NumpyNetwork multiplies
+with, so a loaded file is used through read-only views of its memory map without any copy, and
+the processes that load the same file share its pages.
+
+The legacy .npy files (a pickled dict with the flat solution) are still readable with load_agent_file.
+"""
+
+import argparse
+import json
+import os
+import struct
+import numpy as np
+
+MAGIC = b"PWNN"
+FORMAT_VERSION = 1
+PREFIX = struct.Struct("<4sII")  # Magic, format version, length of the JSON header
+ALIGN = 64  # Offsets of the arrays are multiples of a cache line
+DTYPES = {"float32": "<f4", "float64": "<f8"}
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def layer_sizes(agent_dict):
+    """The input, hidden and output sizes of the network of an agent"""
+    num_planets = int(agent_dict["num_planets"])
+    num_features = int(agent_dict["num_features"])
+    return [num_planets * num_features] + [int(h) for h in agent_dict["hidden_sizes"]] + [num_planets + 2]
+
+def split_solution(solution, sizes, dtype):
+    """The (in, out) weight matrices and the biases of a flat solution in the NeuralNetwork.set_model_weights layout"""
+    solution = np.asarray(solution, dtype=np.float64)
+    weights, biases = [], []
+    prev_ind = 0
+    for n_in, n_out in zip(sizes[:-1], sizes[1:]):
+        weights.append(np.ascontiguousarray(solution[prev_ind:prev_ind + n_in * n_out].reshape(n_out, n_in).T, dtype=dtype))
+        prev_ind += n_in * n_out
+        biases.append(np.ascontiguousarray(solution[prev_ind:prev_ind + n_out], dtype=dtype))
+        prev_ind += n_out
+    if prev_ind != solution.size:
+        raise ValueError(f"Expected {prev_ind} weights for the layer sizes {sizes}, got {solution.size}")
+    return weights, biases
+
+def flat_solution(agent_dict):
+    """The flat float64 solution of an agent, rebuilt from the layer arrays of a weight file"""
+    if "solution" in agent_dict:
+        return np.asarray(agent_dict["solution"], dtype=np.float64)
+    parts = []
+    for W, b in zip(agent_dict["weights"], agent_dict["biases"]):
+        parts.append(np.asarray(W, dtype=np.float64).T.reshape(-1))  # torch stores (out, in)
+        parts.append(np.asarray(b, dtype=np.float64))
+    return np.concatenate(parts)
+
+def write_weight_file(path, agent_dict, dtype="float32"):
+    """Atomically write the agent (num_planets, num_features, hidden_sizes and its flat solution) as a weight file"""
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown dtype {dtype!r}, expected one of {list(DTYPES)}")
+    sizes = layer_sizes(agent_dict)
+    weights, biases = split_solution(flat_solution(agent_dict), sizes, np.dtype(DTYPES[dtype]))
+
+    # The offsets depend on the header length and the header holds the offsets, so the header
+    # is sized with placeholder offsets first (the offsets never get shorter than their placeholders)
+    arrays = [a for pair in zip(weights, biases) for a in pair]
+    header = {
+        "num_planets": int(agent_dict["num_planets"]),
+        "num_features": int(agent_dict["num_features"]),
+        "hidden_sizes": [int(h) for h in agent_dict["hidden_sizes"]],
+        "dtype": dtype,
+        "layers": [],
+    }
+    def encode(offsets):
+        header["layers"] = [{"weight": {"offset": offsets[2 * i], "shape": list(W.shape)},
+                             "bias": {"offset": offsets[2 * i + 1], "shape": list(b.shape)}}
+                            for i, (W, b) in enumerate(zip(weights, biases))]
+        return json.dumps(header).encode()
+    data_start = _aligned(PREFIX.size + len(encode([10**12] * len(arrays))))
+    offsets, position = [], data_start
+    for a in arrays:
+        offsets.append(position)
+        position = _aligned(position + a.nbytes)
+    header_bytes = encode(offsets)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for offset, a in zip(offsets, arrays):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(a.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)  # A loading agent sees either the old or the new file
+
+def is_weight_file(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def read_weight_file(path):
+    """The agent dict of a weight file, its weights and biases are read-only views of the memory-mapped file"""
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    magic, version, header_len = PREFIX.unpack(buffer[:PREFIX.size].tobytes())
+    if magic != MAGIC:
+        raise ValueError(f"{path!r} is not a weight file")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Weight file version {version} of {path!r} is newer than the supported version {FORMAT_VERSION}")
+    header = json.loads(buffer[PREFIX.size:PREFIX.size + header_len].tobytes())
+    dtype = np.dtype(DTYPES[header["dtype"]])
+    def view(entry):
+        return np.ndarray(tuple(entry["shape"]), dtype=dtype, buffer=buffer, offset=int(entry["offset"]))
+    return {
+        "num_planets": header["num_planets"],
+        "num_features": header["num_features"],
+        "hidden_sizes": header["hidden_sizes"],
+        "weights": [view(layer["weight"]) for layer in header["layers"]],
+        "biases": [view(layer["bias"]) for layer in header["layers"]],
+    }
+
+def load_agent_file(path):
+    """The agent dict of a weight file, or of a legacy .npy file (with the flat solution instead of the layers)"""
+    if is_weight_file(path):
+        return read_weight_file(path)
+    return np.load(path, allow_pickle=True).item()
+
+def save_agent_file(path, agent_dict, dtype="float32"):
+    """Save an agent as a weight file, or in the legacy .npy format when the path ends with .npy"""
+    if path.endswith(".npy"):
+        np.save(path, agent_dict)
+    else:
+        write_weight_file(path, agent_dict, dtype)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a legacy .npy agent file into a memory-mappable .pwnn weight file.")
+    parser.add_argument("infile", type=str, help="Agent file to convert (.npy or .pwnn)")
+    parser.add_argument("outfile", type=str, nargs="?", help="Output weight file (default: the input with the .pwnn extension)")
+    parser.add_argument("--dtype", type=str, default="float32", help="Storage dtype: float32 or float64 (default: float32)")
+    args = parser.parse_args()
+    outfile = args.outfile or os.path.splitext(args.infile)[0] + ".pwnn"
+    write_weight_file(outfile, load_agent_file(args.infile), args.dtype)
+    print(f"Wrote {outfile} ({os.path.getsize(outfile)} bytes)")
+
+if __name__ == "__main__":
+    main()